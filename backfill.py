@@ -0,0 +1,125 @@
+"""Streams a last.fm user's entire scrobble history to month-partitioned Parquet
+
+    python backfill.py jasminexx18 --out history
+
+Pages are fetched one at a time (memory stays at one page), and a checkpoint is
+written after each page, so an interrupted run picks up where it stopped when
+re-run with the same arguments. Output is laid out as
+
+    <out>/user=<user>/month=<YYYY-MM>/page-<n>.parquet
+
+so readers can prune to the months they need (see `load_history`).
+"""
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import ingest
+import scrobble_store
+from lastfm_client import lastfm_get
+from rate_limit import LASTFM_LIMITER
+
+### CONSTANTS ###
+PAGE_SIZE = 200
+
+SCHEMA = pa.schema([("track", pa.string()),
+                    ("artist", pa.string()),
+                    ("album", pa.string()),
+                    ("uts", pa.int64())])
+
+### FUNCTIONS ###
+def read_checkpoint(path, user):
+    """The saved progress for `user`, or a fresh one pinned to the current time"""
+
+    if os.path.exists(path):
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint["user"] == user:
+            return checkpoint
+
+    return {"user": user, "to": int(time.time()), "next_page": 1, "total_pages": None}
+
+def write_checkpoint(path, checkpoint):
+    """Atomically replaces the checkpoint file"""
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+def write_page(out, user, page, columns):
+    """Writes one page's scrobbles, split by TIMEZONE month; re-running a page overwrites it"""
+
+    by_month = defaultdict(list)
+    for i, uts in enumerate(columns["uts"].tolist()):
+        by_month[scrobble_store.local_day(uts)[:7]].append(i)
+
+    for month, rows in by_month.items():
+        partition = os.path.join(out, f"user={user}", f"month={month}")
+        os.makedirs(partition, exist_ok=True)
+
+        table = pa.table({"track": [columns["Track"][i] for i in rows],
+                          "artist": [columns["Artist"][i] for i in rows],
+                          "album": [columns["Album"][i] for i in rows],
+                          "uts": columns["uts"][rows]},
+                         schema=SCHEMA)
+        pq.write_table(table, os.path.join(partition, f"page-{page:06d}.parquet"))
+
+def backfill(user, out, checkpoint_path, store=None):
+    """Fetches every remaining page of the user's history, oldest pages last"""
+
+    checkpoint = read_checkpoint(checkpoint_path, user)
+
+    # `to` stays pinned across resumes, so page numbers keep pointing at the same scrobbles
+    while checkpoint["total_pages"] is None or checkpoint["next_page"] <= checkpoint["total_pages"]:
+        page = checkpoint["next_page"]
+
+        LASTFM_LIMITER.acquire()
+        response = lastfm_get({'method': 'user.getRecentTracks',
+                               'user': user,
+                               'to': checkpoint["to"],
+                               'limit': str(PAGE_SIZE),
+                               'page': page})
+        recent = response.json()["recenttracks"]
+        columns = ingest.recent_tracks_to_columns(recent["track"])
+
+        write_page(out, user, page, columns)
+        if store is not None:
+            scrobble_store.insert_scrobbles(store, user, columns)
+
+        checkpoint["total_pages"] = int(recent["@attr"]["totalPages"])
+        checkpoint["next_page"] = page + 1
+        write_checkpoint(checkpoint_path, checkpoint)
+
+        print(f"page {page}/{checkpoint['total_pages']}: {len(columns['uts'])} scrobbles")
+
+def load_history(out, user, months=None, columns=None):
+    """Reads a user's backfilled history, touching only the requested "YYYY-MM" partitions"""
+
+    dataset = ds.dataset(os.path.join(out, f"user={user}"), format="parquet", partitioning="hive")
+    expression = ds.field("month").isin(months) if months else None
+
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("user", help="last.fm username")
+    parser.add_argument("--out", default="history", help="root directory for the Parquet partitions")
+    parser.add_argument("--checkpoint", help="progress file (default: <out>/<user>.checkpoint.json)")
+    parser.add_argument("--store", action="store_true", help="also load scrobbles into the local scrobble store")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    checkpoint_path = args.checkpoint or os.path.join(args.out, f"{args.user}.checkpoint.json")
+    store = scrobble_store.connect() if args.store else None
+
+    backfill(args.user, args.out, checkpoint_path, store=store)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""Times the ingestion and aggregation paths on synthetic listening histories
+
+    python benchmark.py                       # 1k and 100k scrobbles
+    python benchmark.py --large               # ... and 10M
+    python benchmark.py --baseline old.json   # exit 1 on regressions
+
+Synthetic last.fm user.getRecentTracks / user.getTopTracks pages and Spotify
+recently-played items are generated with a fixed seed. Results are written as JSON
+(to --out, bench_output.txt by default), one entry per (benchmark, size), so runs
+can be diffed or checked against a baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import scrobble_store
+
+### CONSTANTS ###
+SIZES = [1_000, 100_000]
+LARGE_SIZE = 10_000_000
+
+PAGE_SIZE = 200
+# rows handed to the store per insert, roughly what one sync turn brings in
+INSERT_CHUNK = 10_000
+GRID_PAGE_SIZE = 100
+# shipping the whole frame to the grid is only measured up to this size
+MAX_FULL_GRID = 1_000_000
+# user.getTopTracks payloads are capped like the dashboard's own requests
+MAX_TOP_TRACKS = 50_000
+
+SEED = 18
+START_UTS = 1_700_000_000
+SECONDS_PER_SCROBBLE = 180
+
+USER = "benchmark"
+
+### FUNCTIONS ###
+def catalogue(size, rng):
+    """Track/artist/album names and a Zipf-ish play distribution sized to the history"""
+
+    n_tracks = max(50, min(size // 5, 200_000))
+    n_artists = max(10, n_tracks // 10)
+    track_artist = rng.integers(0, n_artists, n_tracks)
+
+    weights = 1 / np.arange(1, n_tracks + 1) ** 0.8
+
+    return {"tracks": [f"Track {i}" for i in range(n_tracks)],
+            "artists": [f"Artist {track_artist[i]}" for i in range(n_tracks)],
+            "albums": [f"Album {track_artist[i]}-{i % 7}" for i in range(n_tracks)],
+            "weights": weights / weights.sum()}
+
+def recent_tracks_pages(size, rng, cat):
+    """Yields user.getRecentTracks response bodies (JSON text), newest page first"""
+
+    end_uts = START_UTS + size * SECONDS_PER_SCROBBLE
+    pages = -(-size // PAGE_SIZE)
+
+    for page in range(pages):
+        count = min(PAGE_SIZE, size - page * PAGE_SIZE)
+        picks = rng.choice(len(cat["tracks"]), count, p=cat["weights"])
+        tracks = [{"name": cat["tracks"][i],
+                   "artist": {"#text": cat["artists"][i], "mbid": ""},
+                   "album": {"#text": cat["albums"][i], "mbid": ""},
+                   "mbid": "",
+                   "image": [{"#text": "", "size": "small"}],
+                   "date": {"uts": str(end_uts - (page * PAGE_SIZE + j) * SECONDS_PER_SCROBBLE)}}
+                  for j, i in enumerate(picks)]
+
+        yield json.dumps({"recenttracks": {"track": tracks,
+                                           "@attr": {"page": str(page + 1),
+                                                     "totalPages": str(pages),
+                                                     "total": str(size)}}})
+
+def top_tracks_payload(size, cat):
+    """A user.getTopTracks track list, one entry per catalogue track up to MAX_TOP_TRACKS"""
+
+    count = min(len(cat["tracks"]), MAX_TOP_TRACKS, size)
+
+    return [{"@attr": {"rank": str(i + 1)},
+             "name": cat["tracks"][i],
+             "artist": {"name": cat["artists"][i]},
+             "mbid": "",
+             "image": [{"#text": "", "size": "small"}, {"#text": "", "size": "medium"}],
+             "playcount": str(max(1, size // (i + 1)))}
+            for i in range(count)]
+
+def spotify_items(size, rng, cat):
+    """Yields chunks of current_user_recently_played items"""
+
+    end_ms = (START_UTS + size * SECONDS_PER_SCROBBLE) * 1000
+
+    for start in range(0, size, INSERT_CHUNK):
+        picks = rng.choice(len(cat["tracks"]), min(INSERT_CHUNK, size - start), p=cat["weights"])
+        yield [{"played_at": datetime.fromtimestamp((end_ms - (start + j) * SECONDS_PER_SCROBBLE * 1000) / 1000,
+                                                    timezone.utc).isoformat(),
+                "track": {"name": cat["tracks"][i],
+                          "artists": [{"name": cat["artists"][i]}],
+                          "album": {"name": cat["albums"][i]},
+                          "uri": f"spotify:track:{i}"}}
+               for j, i in enumerate(picks)]
+
+def best_of(fn, repeat):
+    """(fastest wall time in seconds, last result) over `repeat` runs of fn()"""
+
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = fn()
+        times.append(time.perf_counter() - started)
+
+    return min(times), value
+
+def run_size(size, repeat, results):
+    rng = np.random.default_rng(SEED)
+    cat = catalogue(size, rng)
+
+    def record(name, seconds, **extra):
+        results.append({"name": name, "size": size, "seconds": round(seconds, 6),
+                        "rows_per_second": round(size / seconds) if seconds else None, **extra})
+        print(f"{name:<28} {size:>12,} {seconds:>10.4f}s", file=sys.stderr)
+
+    # ingestion: JSON page -> columns -> categorical frame (page generation isn't timed)
+    seconds = 0
+    chunks = ingest.ScrobbleColumns()
+    for body in recent_tracks_pages(size, rng, cat):
+        started = time.perf_counter()
+        chunks.append(ingest.recent_tracks_to_columns(json.loads(body)["recenttracks"]["track"]))
+        seconds += time.perf_counter() - started
+    record("ingest_recent_tracks", seconds)
+
+    columns = chunks.columns()
+    seconds, frame = best_of(lambda: ingest.columns_to_frame(columns), repeat)
+    record("columns_to_frame", seconds, memory_bytes=int(frame.memory_usage(deep=True).sum()))
+
+    top_tracks = top_tracks_payload(size, cat)
+    seconds, _ = best_of(lambda: ingest.top_tracks_to_frame(top_tracks), repeat)
+    record("top_tracks_to_frame", seconds, entries=len(top_tracks))
+
+    week_start = frame["uts"].max() - 7 * 24 * 60 * 60
+
+    def groupby_ranking():
+        week = frame[frame["uts"] >= week_start]
+        return (week.groupby(["Track", "Artist", "Album"], observed=True).size()
+                .sort_values(ascending=False).reset_index(name="Streams"))
+    seconds, _ = best_of(groupby_ranking, repeat)
+    record("week_groupby_ranking", seconds)
+
+    seconds, _ = best_of(lambda: frame["Artist"].value_counts().loc[lambda counts: counts > 0], repeat)
+    record("artist_value_counts", seconds)
+
+    seconds, _ = best_of(lambda: ingest.listened_at(frame["uts"], scrobble_store.TIMEZONE), repeat)
+    record("listened_at", seconds)
+
+    seconds, _ = best_of(lambda: ingest.listened_at(frame["uts"], scrobble_store.TIMEZONE)
+                         .dt.strftime("%d %b %Y, %H:%M %Z"), repeat)
+    record("listened_at_strftime", seconds)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = scrobble_store.connect(os.path.join(tmp, "bench.db"))
+
+        # store ingestion, rollups included
+        started = time.perf_counter()
+        for i in range(0, size, INSERT_CHUNK):
+            scrobble_store.insert_scrobbles(conn, USER, {column: values[i:i + INSERT_CHUNK]
+                                                         for column, values in columns.items()})
+        record("store_insert_scrobbles", time.perf_counter() - started)
+
+        week_day = scrobble_store.local_day(int(week_start))
+        seconds, _ = best_of(lambda: scrobble_store.top_tracks_between(conn, USER, week_day), repeat)
+        record("store_week_ranking", seconds)
+
+        seconds, _ = best_of(lambda: scrobble_store.artist_plays_between(conn, USER, "0000-00-00"), repeat)
+        record("store_artist_plays", seconds)
+
+        # grid payloads: what the Recently Played grid sends to the browser
+        def page_payload(sort=None):
+            page, _ = scrobble_store.read_page(conn, "scrobbles", USER, 0, GRID_PAGE_SIZE, sort=sort)
+            page["Listened at"] = ingest.listened_at(page["uts"], scrobble_store.TIMEZONE).dt.strftime("%d %b %Y, %H:%M %Z")
+            return page.drop(columns="uts").to_json(orient="records")
+        seconds, payload = best_of(page_payload, repeat)
+        record("grid_page_payload", seconds, payload_bytes=len(payload))
+
+        seconds, payload = best_of(lambda: page_payload(sort="Artist"), repeat)
+        record("grid_page_payload_sorted", seconds, payload_bytes=len(payload))
+
+        if size <= MAX_FULL_GRID:
+            def full_payload():
+                full = frame.copy()
+                full["Listened at"] = ingest.listened_at(full["uts"], scrobble_store.TIMEZONE).dt.strftime("%d %b %Y, %H:%M %Z")
+                return full.drop(columns="uts").to_json(orient="records")
+            seconds, payload = best_of(full_payload, 1)
+            record("grid_full_payload", seconds, payload_bytes=len(payload))
+
+        seconds = 0
+        for items in spotify_items(size, rng, cat):
+            started = time.perf_counter()
+            scrobble_store.insert_spotify_plays(conn, USER, items)
+            seconds += time.perf_counter() - started
+        record("store_insert_spotify_plays", seconds)
+
+        seconds, _ = best_of(lambda: scrobble_store.read_page(conn, "spotify_plays", USER, 0, GRID_PAGE_SIZE), repeat)
+        record("spotify_page", seconds)
+
+        conn.close()
+
+def environment():
+    try:
+        # the repo's commit, wherever the script is run from
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+
+    return {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": commit or None,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "platform": platform.platform()}
+
+def regressions(results, baseline, tolerance):
+    """Entries more than `tolerance` times slower than the same (name, size) in `baseline`"""
+
+    previous = {(entry["name"], entry["size"]): entry["seconds"] for entry in baseline["results"]}
+
+    return [{**entry, "baseline_seconds": previous[(entry["name"], entry["size"])]}
+            for entry in results
+            if previous.get((entry["name"], entry["size"]))
+            and entry["seconds"] > previous[(entry["name"], entry["size"])] * tolerance]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="history sizes, in scrobbles")
+    parser.add_argument("--large", action="store_true", help=f"also run {LARGE_SIZE:,} scrobbles")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per repeatable benchmark (fastest is kept)")
+    parser.add_argument("--out", default="bench_output.txt")
+    parser.add_argument("--baseline", help="earlier --out file to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="slowdown factor counted as a regression")
+    args = parser.parse_args()
+
+    sizes = args.sizes + ([LARGE_SIZE] if args.large and LARGE_SIZE not in args.sizes else [])
+    results = []
+    for size in sizes:
+        run_size(size, args.repeat, results)
+
+    report = {"environment": environment(), "results": results}
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = regressions(results, json.load(f), args.tolerance)
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for entry in report.get("regressions", []):
+        print(f"REGRESSION {entry['name']} @ {entry['size']:,}: "
+              f"{entry['baseline_seconds']:.4f}s -> {entry['seconds']:.4f}s", file=sys.stderr)
+
+    sys.exit(1 if report.get("regressions") else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import os
+
+import requests
+
+from disk_cache import DiskCache
+from rate_limit import RateLimiter
+
+### CONSTANTS ###
+USER_AGENT = os.getenv('LASTFM_USER_AGENT')
+FALLBACK_IMAGE = "https://lastfm.freetls.fastly.net/i/u/64s/2a96cbd8b46e442fc41c2b86b821562f.png"
+
+DAY = 24 * 60 * 60
+COVER_TTL = 90 * DAY
+NO_COVER_TTL = 7 * DAY
+MAX_ENTRIES = 20_000
+MAX_WORKERS = 4
+TIMEOUT = 10
+
+# https://musicbrainz.org/doc/MusicBrainz_API/Rate_Limiting - one request per second
+MUSICBRAINZ_LIMITER = RateLimiter(1, 1)
+
+COVERS = DiskCache("coverart", COVER_TTL, MAX_ENTRIES, negative_ttl=NO_COVER_TTL)
+
+### FUNCTIONS ###
+def get_track_coverart(track_mbid):
+    """Looks up the small front-cover thumbnail for a recording (None if there isn't one)"""
+
+    headers = {'user-agent': USER_AGENT}
+
+    musicbrainz_url = f"https://musicbrainz.org/ws/2/recording/{track_mbid}?inc=releases&fmt=json"
+    MUSICBRAINZ_LIMITER.acquire()
+    response = requests.get(musicbrainz_url, headers=headers, timeout=TIMEOUT)
+
+    # 404 is a real "no such recording"; throttling and outages are not
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+
+    releases = response.json().get("releases", [])
+
+    if releases:
+        release_mbid = releases[0].get("id")
+        cover_art_url = f"https://coverartarchive.org/release/{release_mbid}/"
+        cover_response = requests.get(cover_art_url, headers=headers, timeout=TIMEOUT)
+
+        if cover_response.status_code == 404:
+            return None
+        cover_response.raise_for_status()
+
+        for image in cover_response.json().get("images", []):
+
+            if image.get("front", False):
+                return image.get("thumbnails")["small"]
+
+    return None
+
+def uncached(track_mbids):
+    """The mbids with no cached result yet, in order"""
+
+    track_mbids = [mbid for mbid in dict.fromkeys(track_mbids) if mbid]
+    cached = COVERS.get_many(track_mbids)
+
+    return [mbid for mbid in track_mbids if mbid not in cached]
+
+def get_coverart(track_mbids, fetch_misses=True):
+    """Returns {mbid: thumbnail url} for every mbid, falling back to FALLBACK_IMAGE
+
+    Cached thumbnails (and cached "no cover" results) cost nothing; the rest are
+    resolved concurrently, with the MusicBrainz leg held to one request per second.
+    With `fetch_misses=False` nothing is requested and misses get FALLBACK_IMAGE.
+    """
+
+    track_mbids = [mbid for mbid in dict.fromkeys(track_mbids) if mbid]
+    covers = COVERS.lookup({mbid: mbid for mbid in track_mbids}, get_track_coverart, fetch_misses,
+                           max_workers=MAX_WORKERS)
+
+    return {mbid: url or FALLBACK_IMAGE for mbid, url in covers.items()}
@@ -1,18 +1,17 @@
 import streamlit as st
 import os
 from dotenv import load_dotenv
-import pandas as pd
-from st_aggrid import AgGrid, JsCode, ColumnsAutoSizeMode, AgGridTheme
-from st_aggrid.grid_options_builder import GridOptionsBuilder
 from datetime import datetime, timedelta
 import pytz
-from pytz import timezone
-import requests
-from concurrent.futures import ThreadPoolExecutor
 import plotly.graph_objects as go
 import plotly.express as px
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
+import data_layer
+import grid
+import metrics
+import lazy_tabs
+import tag_cloud
+import ingest
+import summary
 
 ### ENV. VARIABLES ###
 load_dotenv()
@@ -21,9 +20,8 @@ TIMEZONE = pytz.timezone("US/Central")
 NOW = datetime.now(TIMEZONE)
 MONDAY = (NOW - timedelta(days = NOW.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
 
-USER_AGENT = os.getenv('LASTFM_USER_AGENT')
-API_KEY = os.getenv('LASTFM_API_KEY')
-LASTFM_USER = "jasminexx18"
+# one deployment serves many listeners: ?user=<name>, falling back to the configured default
+LASTFM_USER = st.query_params.get("user", os.getenv("LASTFM_USER", "jasminexx18"))
 
 THEME = {"background_color": "#082D1B",
          "button_color": "#0E290E",
@@ -69,104 +67,6 @@ def apply_theme(selected_theme):
     """
     st.markdown(css, unsafe_allow_html=True)
 
-def lastfm_get(payload):
-    """Function to streamline API calls"""
-
-    headers = {'user-agent': USER_AGENT}
-    url = 'https://ws.audioscrobbler.com/2.0/'
-
-    # Add API key and format to the payload
-    payload['api_key'] = API_KEY
-    payload['format'] = 'json'
-
-    response = requests.get(url, headers=headers, params=payload)
-    
-    return response
-
-def process_track(track):
-
-    track_info = {
-        "Rank": track["@attr"]["rank"],
-        # "track_image": get_track_coverart(track["mbid"]) if track["mbid"] else track["image"][1]["#text"],
-        "Track": track["name"],
-        "Artist": track["artist"]["name"],
-        "Streams": track["playcount"]
-        # "Duration": track["duration"]
-    }
-
-    return track_info
-
-def extract_track_data(track): 
-    """Extracts track data for user.getRecentTracks"""
-
-    track_info = {
-        "Track": track["name"],
-        "Artist": track["artist"]["#text"],
-        "Album": track["album"]["#text"],
-        "Listened at": track["date"]["#text"]
-    }
-
-    return track_info
-
-def get_recently_played(): 
-    """Retrieve the last 100 most recently-played tracks"""
-
-    all_tracks = []
-
-    response = lastfm_get({'method': 'user.getRecentTracks', 
-                           'user': "jasminexx18",
-                           'from': int(MONDAY.timestamp()),
-                           'limit': '100', 
-                           'page': '1'})
-        
-    for track in response.json()["recenttracks"]["track"]:
-        if "@attr" not in track.keys():
-            all_tracks.append(extract_track_data(track))
-
-    return pd.DataFrame(all_tracks)
-
-def get_this_week_tracks():
-
-    all_tracks = []
-    i = 1
-
-    initial_response = lastfm_get({'method': 'user.getRecentTracks', 
-                                    'user': "jasminexx18",
-                                    'from': int(MONDAY.timestamp()),
-                                    'limit': '1', 
-                                    'page': i})
-    total_tracks = int(initial_response.json()["recenttracks"]["@attr"]["total"])
-
-    while len(all_tracks) < total_tracks:
-        response = lastfm_get({'method': 'user.getRecentTracks', 
-                                'user': "jasminexx18",
-                                'from': int(MONDAY.timestamp()),
-                                'limit': '200', 
-                                'page': i})
-        
-        for track in response.json()["recenttracks"]["track"]:
-            if "@attr" not in track.keys():
-                all_tracks.append(extract_track_data(track))
-        
-        i += 1
-
-    return pd.DataFrame(all_tracks)
-
-def get_track_top_tags(track, artist):
-
-    remove = ["seen live", "love", "favorites", "favorite", 'favorite songs']
-
-    r = lastfm_get({'method': 'track.getTopTags', 
-                    'user': "jasminexx18",
-                    'artist': artist,
-                    'track': track})
-    
-    tags = r.json()["toptags"]["tag"]
-    tags = [tag["name"].lower() for tag in tags] if len(tags) else []
-    tags = [tag for tag in tags if tag not in remove]
-    
-    return tags
-
 # page configurations
 st.set_page_config(
     page_title="Spotify Dashboard",
@@ -174,58 +74,40 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded")
 
-st.set_option('deprecation.showPyplotGlobalUse', False)
+data_layer.start_metrics_server()
 
 ### UI ###
 st.title(":bar_chart: Jasmine's *Custom* Streaming Dashboard")
 
 apply_theme(THEME)
 
-(tab_this_week, 
- tab_top_artists, 
- tab_top_tracks,
- tab_recently_played) = st.tabs(["This Week", "Top Artists", "Top Tracks", "Recently Played"])
+# keeps this listener at the front of the background sync queue
+data_layer.mark_active(LASTFM_USER)
+# maps the rollup snapshot up front; later sessions in this process reuse the mapping
+data_layer.get_snapshot(LASTFM_USER)
+
+# memoized API results otherwise live out their TTLs; only this listener's are dropped
+if st.button("Refresh data"):
+    data_layer.invalidate(user=LASTFM_USER)
 
-with tab_this_week: 
+synced_at = data_layer.last_synced(LASTFM_USER)
+st.caption(f"Last synced at {datetime.fromtimestamp(synced_at, TIMEZONE).strftime('%d %b %Y, %H:%M %Z')}"
+           if synced_at else "Not synced yet")
 
-    all_tracks = get_this_week_tracks()
+def render_this_week(): 
 
     col1, col2 = st.columns([1.5, 1])
 
     with col1: 
-        this_week_tracks = all_tracks.groupby(["Track", "Artist", "Album"])["Track"].count().reset_index(name="Streams").sort_values("Streams", ascending=False)
-        this_week_tracks["Rank"] = list(range(1, this_week_tracks.shape[0] + 1))
-        this_week_tracks = this_week_tracks[["Rank", "Track", "Artist", "Album", "Streams"]]
+        this_week_tracks = data_layer.week_top_tracks(LASTFM_USER, MONDAY)
         
         st.markdown(f"### Your Top Tracks since {MONDAY.date()}")
-        builder = GridOptionsBuilder.from_dataframe(this_week_tracks)
-        builder.configure_column("Track",
-                                 cellStyle={"fontWeight": "bold"})
-                                 #maxWidth=250)  
-        # builder.configure_column("Artist",
-        #                          maxWidth=200)  
-        # builder.configure_column("Album",
-        #                          maxWidth=250)  
-        # builder.configure_column("Rank",
-        #                          maxWidth=100)  
-        # builder.configure_column("Streams",
-        #                          maxWidth=120)  
-        
-        builder.configure_grid_options(rowHeight=50, suppressColumnVirtualisation=True) 
-        builder.configure_grid_options(onFirstDataRendered="function() { gridOptions.api.sizeColumnsToFit(); }")
-
-        options = builder.build()
-
-        grid = AgGrid(this_week_tracks, 
-                        gridOptions=options,
-                        columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS,
-                        allow_unsafe_jscode=True, 
-                        theme=AgGridTheme.ALPINE,
-                        height=800)
+        grid.show(this_week_tracks,
+                  grid.options(this_week_tracks, bold="Track", fit_columns=True))
     
     with col2: 
         st.markdown("#### Artist Representation")
-        artist_counts = this_week_tracks.value_counts().reset_index()
+        artist_counts = data_layer.week_artist_plays(LASTFM_USER, MONDAY)
         labels = artist_counts["Artist"]
         values = artist_counts["count"]
 
@@ -234,7 +116,7 @@ with tab_this_week:
                                      hole=.3,
                                      marker=dict(colors=px.colors.qualitative.Alphabet),
                                      hovertemplate=('<b>%{label}</b><br>' 
-                                                    '# of tracks: %{value}<br>' 
+                                                    '# of streams: %{value}<br>' 
                                                     'Pct.: %{percent:.2%}<br>' 
                                                     '<extra></extra>'))])
         
@@ -242,42 +124,50 @@ with tab_this_week:
         st.plotly_chart(fig, use_container_width=True)
 
         st.markdown("#### Top Tags")
-        top_tags = []
-
-        for i, row in this_week_tracks.iterrows(): 
-
-            artist = row["Artist"]
-            track = row["Track"]
-
-            top_tags += get_track_top_tags(track, artist)
-
-        text = " ".join(top_tags)
-        wordcloud = WordCloud().generate(text)
-        plt.imshow(wordcloud, interpolation='bilinear')
-        plt.axis("off")
-        plt.show()
-        st.pyplot()
+        pairs = list(zip(this_week_tracks["Track"], this_week_tracks["Artist"]))
+        streams = this_week_tracks["Streams"].tolist()
+
+        def draw_tag_cloud(frequencies):
+            with metrics.timer("render_seconds", part="wordcloud"):
+                png = tag_cloud.render_png(frequencies)
+
+            if png is None:
+                st.caption("No tags yet")
+            else:
+                st.image(png, use_container_width=True)
+
+        tag_source = st.radio("Tags from", ["Artists", "Tracks"], horizontal=True, key="tag_source")
+        frequencies = (data_layer.week_artist_tag_frequencies if tag_source == "Artists"
+                       else data_layer.week_tag_frequencies)
+
+        # the tag fan-out is the slow part of this tab - let the rest paint first
+        lazy_tabs.when_ready((tag_source, LASTFM_USER, MONDAY, hash(tuple(pairs)), hash(tuple(streams))),
+                             frequencies, (LASTFM_USER, MONDAY, pairs, streams),
+                             draw_tag_cloud, placeholder="Loading tags...")
     
-with tab_recently_played: 
-
-    recently_played = get_recently_played()
-    recently_played["Listened at"] = pd.to_datetime(recently_played["Listened at"], format="%d %b %Y, %H:%M").dt.tz_localize("UTC")
-    recently_played["Listened at"] = recently_played["Listened at"].dt.tz_convert(timezone("US/Central"))
-    recently_played["Listened at"] = recently_played["Listened at"].dt.strftime("%d %b %Y, %H:%M %Z")
-
-    st.markdown(f"### Recently Played")
-    builder = GridOptionsBuilder.from_dataframe(recently_played)
-    builder.configure_column("Track",
-                             cellStyle={"fontWeight": "bold"})
-    
-    builder.configure_grid_options(rowHeight=50, suppressColumnVirtualisation=True) 
-    builder.configure_grid_options(onFirstDataRendered="function() { gridOptions.api.sizeColumnsToFit(); }")
-
-    options = builder.build()
-
-    grid = AgGrid(recently_played, 
-                  gridOptions=options,
-                  columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS,
-                  allow_unsafe_jscode=True, 
-                  theme=AgGridTheme.ALPINE,
-                  height=800)
\ No newline at end of file
+def render_recently_played(): 
+
+    data_layer.sync_scrobbles(LASTFM_USER, MONDAY)
+
+    def format_scrobbles(page):
+        page["Listened at"] = ingest.listened_at(page["uts"], TIMEZONE).dt.strftime("%d %b %Y, %H:%M %Z")
+        return page.drop(columns="uts")
+
+    st.markdown("### Recently Played")
+    # the whole stored history, a page at a time
+    grid.paged("recently_played",
+               lambda *page: data_layer.scrobbles_page(LASTFM_USER, None, None, *page),
+               sortable={"Listened at": "uts", "Track": "Track",
+                         "Artist": "Artist", "Album": "Album"},
+               format=format_scrobbles,
+               bold="Track",
+               fit_columns=True)
+
+lazy_tabs.render({"Summary": lambda: summary.render(LASTFM_USER, MONDAY),
+                  "This Week": render_this_week,
+                  "Top Artists": lambda: None,
+                  "Top Tracks": lambda: None,
+                  "Recently Played": render_recently_played},
+                 key="tab")
+
+metrics.render_debug_panel()
@@ -1,17 +1,25 @@
 import streamlit as st
-import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 import os
 from dotenv import load_dotenv
 import pandas as pd
-from st_aggrid import AgGrid, JsCode, ColumnsAutoSizeMode, AgGridTheme
-from st_aggrid.grid_options_builder import GridOptionsBuilder
+from st_aggrid import ColumnsAutoSizeMode
 from datetime import datetime, timedelta
 import pytz
-import requests
-from concurrent.futures import ThreadPoolExecutor
 import plotly.graph_objects as go
 import plotly.express as px
+import data_layer
+import grid
+import metrics
+import lazy_tabs
+import ingest
+import range_index
+import coverart
+import spotify_session
+import spotify_history
+import summary
+import thumbnails
+import top_artists
 
 
 # load environmental vars - includes spotify API credentials
@@ -30,9 +38,8 @@ TIMEZONE = pytz.timezone("US/Central")
 NOW = datetime.now(TIMEZONE)
 MONDAY = (NOW - timedelta(days = NOW.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
 
-USER_AGENT = os.getenv('LASTFM_USER_AGENT')
-API_KEY = os.getenv('LASTFM_API_KEY')
-LASTFM_USER = "jasminexx18"
+# one deployment serves many listeners: ?user=<name>, falling back to the configured default
+LASTFM_USER = st.query_params.get("user", os.getenv("LASTFM_USER", "jasminexx18"))
 
 def apply_theme(selected_theme):
     css = f"""
@@ -67,75 +74,6 @@ def apply_theme(selected_theme):
     """
     st.markdown(css, unsafe_allow_html=True)
 
-def lastfm_get(payload):
-    """Function to streamline API calls"""
-
-    headers = {'user-agent': USER_AGENT}
-    url = 'https://ws.audioscrobbler.com/2.0/'
-
-    # Add API key and format to the payload
-    payload['api_key'] = API_KEY
-    payload['format'] = 'json'
-
-    response = requests.get(url, headers=headers, params=payload)
-    
-    return response
-
-def get_track_coverart(track_mbid):
-
-    # time.sleep(0.1)
-
-    try:
-        musicbrainz_url = f"https://musicbrainz.org/ws/2/recording/{track_mbid}?inc=releases&fmt=json"
-        response = requests.get(musicbrainz_url)
-
-        if response.status_code == 200:
-            data = response.json()
-            releases = data.get("releases", [])
-
-            if releases:
-                release_mbid = releases[0].get("id")
-                cover_art_url = f"https://coverartarchive.org/release/{release_mbid}/"
-                cover_response = requests.get(cover_art_url)
-
-                if cover_response.status_code == 200:
-                    cover_data = cover_response.json()
-
-                    for image in cover_data.get("images", []):
-
-                        if image.get("front", False):
-                            return image.get("thumbnails")["small"]       
-                        
-    except Exception as e:
-        print(f"Error fetching cover art for {track_mbid}: {e}")
-
-    return "https://lastfm.freetls.fastly.net/i/u/64s/2a96cbd8b46e442fc41c2b86b821562f.png"
-
-def process_track(track):
-
-    track_info = {
-        "Rank": track["@attr"]["rank"],
-        # "track_image": get_track_coverart(track["mbid"]) if track["mbid"] else track["image"][1]["#text"],
-        "Track": track["name"],
-        "Artist": track["artist"]["name"],
-        "Streams": track["playcount"]
-        # "Duration": track["duration"]
-    }
-
-    return track_info
-
-def extract_track_data(track): 
-    """Extracts track data for user.getRecentTracks"""
-
-    track_info = {
-        "Track": track["name"],
-        "Artist": track["artist"]["#text"],
-        "Album": track["album"]["#text"],
-        "Listened at": track["date"]["#text"]
-    }
-
-    return track_info
-
 THEME = {"background_color": "#082D1B",
          "button_color": "#0E290E",
          "inputs": "#547054",
@@ -153,6 +91,8 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded")
 
+data_layer.start_metrics_server()
+
 st.title(":bar_chart: Jasmine's *Custom* Streaming Dashboard")
 
 apply_theme(THEME)
@@ -160,6 +100,15 @@ apply_theme(THEME)
 col01, col02, col03 = st.columns(3)
 platform = col01.selectbox("Select platform",
                            options=["last.fm", "Spotify"])
+# keeps this listener at the front of the background sync queue
+data_layer.mark_active(LASTFM_USER)
+# maps the rollup snapshot up front; later sessions in this process reuse the mapping
+data_layer.get_snapshot(LASTFM_USER)
+
+# memoized API results otherwise live out their TTLs; only this listener's are dropped
+refresh = col03.button("Refresh data")
+if refresh and platform == "last.fm":
+    data_layer.invalidate(user=LASTFM_USER)
 
 if platform == "Spotify":
 
@@ -172,22 +121,20 @@ if platform == "Spotify":
     if "code" in st.query_params:
 
         code = st.query_params["code"]
-        token_info = OAUTH.get_access_token(code)
-        access_token = token_info["access_token"]
+        token_info = spotify_session.get_token(OAUTH, st.session_state, code)
 
         # use access token to create a Spotify client
-        # SPOTIFY = spotipy.Spotify(auth_manager=sp_oauth)
-        SPOTIFY = spotipy.Spotify(auth=access_token)
+        SPOTIFY, user_dict = spotify_session.get_client(st.session_state, token_info)
+        if refresh:
+            data_layer.invalidate(user=user_dict["id"])
+        # warm every tab's data in the background while the open one renders
+        lazy_tabs.prefetch(data_layer.spotify_prefetch, SPOTIFY, user_dict["id"])
+        # keeps collecting plays between visits, past the API's 50-item window
+        spotify_history.start_accumulator(OAUTH, token_info, data_layer.get_store(), user_dict["id"])
 
-        user_dict = SPOTIFY.current_user()
         st.markdown(f"#### :wave: Hi {user_dict['display_name']}!")
 
-        (tab_summary, 
-        tab_top_artists, 
-        tab_top_tracks, 
-        tab_recently_played) = st.tabs(["Summary", "Top Artists", "Top Tracks", "Recently Played"])
-        
-        with tab_top_artists:
+        def render_spotify_top_artists():
             col1, col2, col3 = st.columns(3)
             time_frame = col1.selectbox("Select a time frame",
                                     options=TIME_FRAMES,
@@ -195,145 +142,59 @@ if platform == "Spotify":
             st.markdown(f"### Your Top Artists: {time_frame}")
             time_frame = "_".join(time_frame.split(" ")).lower()
 
-            top_artists = []
-
-            for i, item in enumerate(SPOTIFY.current_user_top_artists(limit=50, time_range=time_frame)["items"]):
-
-                artist_info = {
-                    "rank": i + 1,
-                    "name": item["name"], 
-                    "uri": item["uri"],
-                    "genres": ', '.join(item["genres"]),
-                    "popularity": item["popularity"],
-                    "followers": item["followers"]["total"],
-                    "image_url": item["images"][1]["url"]
-                }
-
-                top_artists.append(artist_info)
-
-            TOP_ARTISTS = pd.DataFrame(top_artists)
+            TOP_ARTISTS = data_layer.spotify_top_artists(SPOTIFY, user_dict["id"], time_frame)
             cols = ["rank", "image_url", "name", "genres", "popularity"]
 
-            builder = GridOptionsBuilder.from_dataframe(TOP_ARTISTS[cols])
             # TODO: center row contents vertically in their cells
-
-            # allows for artist images to be displayed in the dataframe
-            builder.configure_column("image_url",
-                                    headerName="", 
-                                    width=300,
-                                    cellRenderer=JsCode("""
-                                        class UrlCellRenderer {
-                                        init(params) {
-                                            this.eGui = document.createElement('img');
-                                            this.eGui.setAttribute('src', params.value);
-                                            this.eGui.setAttribute('style', "width:65px;height:65px");
-                                        }
-                                        getGui() {
-                                            return this.eGui;
-                                        }
-                                        }"""
-                                    )
-                                )   
-            builder.configure_grid_options(rowHeight=65) #suppressColumnVirtualisation=True)
-            options = builder.build()
-            grid = AgGrid(TOP_ARTISTS[cols], 
-                        gridOptions=options,
-                        # columns_auto_size_mode=ColumnsAutoSizeMode.NO_AUTOSIZE,
-                        allow_unsafe_jscode=True, 
-                        theme=AgGridTheme.ALPINE,
-                        height=800)
-            
-            with tab_top_tracks:
-                col1, col2, col3 = st.columns(3)
-                time_frame = col1.selectbox("Select a time frame",
-                                        options=TIME_FRAMES)
-                st.markdown(f"### Your Top Tracks: {time_frame}")
-                time_frame = "_".join(time_frame.split(" ")).lower()
-
-                top_tracks = []
-
-                for i, item in enumerate(SPOTIFY.current_user_top_tracks(limit=50, time_range=time_frame)["items"]):
-                    track_info = {
-                        "rank": i + 1,
-                        "name": item["name"],
-                        "artists": ", ".join([art["name"] for art in item["artists"]]),
-                        "album": item["album"]["name"],
-                        "uri": item["uri"],
-                        "image_url": item["album"]["images"][1]["url"],
-                        "popularity": item["popularity"]
-                        
-                    }
-
-                    top_tracks.append(track_info)
-
-                TOP_TRACKS = pd.DataFrame(top_tracks)
-                cols = ["rank", "image_url", "name", "artists", "popularity"]
-
-                builder = GridOptionsBuilder.from_dataframe(TOP_TRACKS[cols])
-                # TODO: center row contents vertically in their cells
-
-                # allows for artist images to be displayed in the dataframe
-                builder.configure_column("image_url",
-                                        headerName="", 
-                                        width=300,
-                                        cellRenderer=JsCode("""
-                                            class UrlCellRenderer {
-                                            init(params) {
-                                                this.eGui = document.createElement('img');
-                                                this.eGui.setAttribute('src', params.value);
-                                                this.eGui.setAttribute('style', "width:65px;height:65px");
-                                            }
-                                            getGui() {
-                                                return this.eGui;
-                                            }
-                                            }"""
-                                        )
-                                    )   
-                builder.configure_grid_options(rowHeight=65) #suppressColumnVirtualisation=True)
-                options = builder.build()
-                grid = AgGrid(TOP_TRACKS[cols], 
-                            gridOptions=options,
-                            # columns_auto_size_mode=ColumnsAutoSizeMode.NO_AUTOSIZE,
-                            allow_unsafe_jscode=True, 
-                            theme=AgGridTheme.ALPINE,
-                            height=800)
+            grid.show(TOP_ARTISTS[cols],
+                      grid.options(TOP_ARTISTS[cols], row_height=65, image_column="image_url", image_width=300),
+                      auto_size=ColumnsAutoSizeMode.NO_AUTOSIZE)
             
-            with tab_recently_played:
-
-                # TODO: enable date range
-                # st.markdown("## Select Date Range to Analyze")
-                # st.date_input("Date range", 
-                #             value=(last_date - default_diff, last_date), 
-                #             min_value=datetime.date(2024, 1, 13),
-                #             max_value=last_date,
-                #             format="MM/DD/YYYY",
-                #             key="date_range")
-
-                recently_played = []
-
-                for i, item in enumerate(SPOTIFY.current_user_recently_played(limit=50)["items"]):
-
-                    song_info = {
-                        "played_at": item["played_at"],
-                        "name": item["track"]["name"],
-                        "artists": ", ".join([art["name"] for art in item["track"]["artists"]])
-                    }
-
-                    recently_played.append(song_info)
+        def render_spotify_top_tracks():
+            col1, col2, col3 = st.columns(3)
+            time_frame = col1.selectbox("Select a time frame",
+                                    options=TIME_FRAMES)
+            st.markdown(f"### Your Top Tracks: {time_frame}")
+            time_frame = "_".join(time_frame.split(" ")).lower()
 
-                RECENTLY_PLAYED = pd.DataFrame(recently_played)
-                RECENTLY_PLAYED["played_at"] = pd.to_datetime(RECENTLY_PLAYED["played_at"]).dt.tz_convert('America/Chicago')
-                RECENTLY_PLAYED["played_at"] = RECENTLY_PLAYED["played_at"].dt.strftime('%Y/%m/%d\t\t%H:%M:%S')
-                
-                builder = GridOptionsBuilder.from_dataframe(RECENTLY_PLAYED)
-                builder.configure_grid_options(rowHeight=30) #suppressColumnVirtualisation=True)
-                options = builder.build()
+            TOP_TRACKS = data_layer.spotify_top_tracks(SPOTIFY, user_dict["id"], time_frame)
+            cols = ["rank", "image_url", "name", "artists", "popularity"]
 
-                AgGrid(RECENTLY_PLAYED,
-                    columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS, 
-                    gridOptions=options,
-                    theme=AgGridTheme.ALPINE,
-                    height=800)
+            # TODO: center row contents vertically in their cells
+            grid.show(TOP_TRACKS[cols],
+                      grid.options(TOP_TRACKS[cols], row_height=65, image_column="image_url", image_width=300),
+                      auto_size=ColumnsAutoSizeMode.NO_AUTOSIZE)
+        
+        def render_spotify_recently_played():
+
+            today = datetime.now(TIMEZONE).date()
+            st.markdown("## Select Date Range to Analyze")
+            date_range = st.date_input("Date range", 
+                                       value=(today - timedelta(days=7), today), 
+                                       max_value=today,
+                                       format="MM/DD/YYYY",
+                                       key="date_range")
+            # mid-selection the picker holds only the start date
+            start, end = range_index.date_range_bounds(date_range[0], date_range[-1])
+
+            def format_plays(page):
+                page["played_at"] = pd.to_datetime(page["played_at"], unit="ms", utc=True).dt.tz_convert('America/Chicago')
+                page["played_at"] = page["played_at"].dt.strftime('%Y/%m/%d\t\t%H:%M:%S')
+                return page
+
+            grid.paged("spotify_recently_played",
+                       lambda *page: data_layer.spotify_plays_page(SPOTIFY, user_dict["id"], start, end, *page),
+                       sortable={"Played at": "played_at", "Track": "name",
+                                 "Artists": "artists", "Album": "album"},
+                       format=format_plays,
+                       scope=(start, end),
+                       row_height=30)
+
+        lazy_tabs.render({"Summary": lambda: None,
+                          "Top Artists": render_spotify_top_artists,
+                          "Top Tracks": render_spotify_top_tracks,
+                          "Recently Played": render_spotify_recently_played},
+                         key="spotify_tab")
 
     # not currently logged in
     else: 
@@ -344,141 +205,92 @@ if platform == "Spotify":
 # lastfm
 else: 
 
-    # can change the tab options - keeping it this for now
-    (tab_this_week, 
-     tab_top_artists, 
-     tab_top_tracks) = st.tabs(["This Week", "Top Artists", "Top Tracks"])
-    
-    with tab_this_week: 
-        tab_top_this_week, tab_recently_played = st.tabs(["Top Tracks", "Recently Played"])
-
-        all_tracks = []
-        i = 1
-
-        initial_response = lastfm_get({'method': 'user.getRecentTracks', 
-                                       'user': "jasminexx18",
-                                       'from': int(MONDAY.timestamp()),
-                                       'limit': '1', 
-                                       'page': i})
-        total_tracks = int(initial_response.json()["recenttracks"]["@attr"]["total"])
-
-        while len(all_tracks) < total_tracks:
-            response = lastfm_get({'method': 'user.getRecentTracks', 
-                                   'user': "jasminexx18",
-                                   'from': int(MONDAY.timestamp()),
-                                   'limit': '200', 
-                                   'page': i})
-            
-            for track in response.json()["recenttracks"]["track"]:
-                if "@attr" not in track.keys():
-                    all_tracks.append(extract_track_data(track))
-            
-            i += 1
+    synced_at = data_layer.last_synced(LASTFM_USER)
+    st.caption(f"Last synced at {datetime.fromtimestamp(synced_at, TIMEZONE).strftime('%d %b %Y, %H:%M %Z')}"
+               if synced_at else "Not synced yet")
 
-        all_tracks = pd.DataFrame(all_tracks)
+    def render_this_week(): 
 
-        with tab_top_this_week:
+        def render_top_this_week():
             
             col1, col2 = st.columns([1.5, 1])
             with col1: 
-                this_week_tracks = all_tracks.groupby(["Track", "Artist", "Album"])["Track"].count().reset_index(name="Streams").sort_values("Streams", ascending=False)
-                this_week_tracks["Rank"] = list(range(1, this_week_tracks.shape[0] + 1))
-                this_week_tracks = this_week_tracks[["Rank", "Track", "Artist", "Album", "Streams"]]
+                this_week_tracks = data_layer.week_top_tracks(LASTFM_USER, MONDAY)
                 
                 st.markdown(f"### Your Top Tracks since {MONDAY.date()}")
-                builder = GridOptionsBuilder.from_dataframe(this_week_tracks)
-                builder.configure_column("Track",
-                                         cellStyle={"fontWeight": "bold"},
-                                         maxWidth=250)  
-                builder.configure_column("Artist",
-                                         maxWidth=200)  
-                builder.configure_column("Album",
-                                         maxWidth=250)  
-                builder.configure_column("Rank",
-                                         maxWidth=100)  
-                builder.configure_column("Streams",
-                                         maxWidth=120)  
-                
-                builder.configure_grid_options(rowHeight=50, suppressColumnVirtualisation=True) 
-                # builder.configure_grid_options(onFirstDataRendered="function() { gridOptions.api.sizeColumnsToFit(); }")
-
-                options = builder.build()
-
-                grid = AgGrid(this_week_tracks, 
-                              gridOptions=options,
-                              columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS,
-                              allow_unsafe_jscode=True, 
-                              theme=AgGridTheme.ALPINE,
-                              height=800)
-
-        with tab_recently_played:
-
-                st.markdown(f"### Your Recently Played since {MONDAY.date()}")
-                builder = GridOptionsBuilder.from_dataframe(all_tracks)
-                builder.configure_column("Track",
-                                         cellStyle={"fontWeight": "bold"})  
-                
-                builder.configure_grid_options(rowHeight=50, suppressColumnVirtualisation=True) 
-                # builder.configure_grid_options(onFirstDataRendered="function() { gridOptions.api.sizeColumnsToFit(); }")
-
-                options = builder.build()
-
-                grid = AgGrid(all_tracks, 
-                              gridOptions=options,
-                              columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS,
-                              allow_unsafe_jscode=True, 
-                              theme=AgGridTheme.ALPINE,
-                              height=800)
-
-    with tab_top_tracks:
+                grid.show(this_week_tracks,
+                          grid.options(this_week_tracks, bold="Track",
+                                       max_widths={"Track": 250, "Artist": 200, "Album": 250,
+                                                   "Rank": 100, "Streams": 120}))
+
+        def render_recently_played():
+
+                data_layer.sync_scrobbles(LASTFM_USER, MONDAY)
+
+                date_range = st.date_input("Date range",
+                                           value=(MONDAY.date(), NOW.date()),
+                                           max_value=datetime.now(TIMEZONE).date(),
+                                           format="MM/DD/YYYY",
+                                           key="lastfm_date_range")
+                start, end = range_index.date_range_bounds(date_range[0], date_range[-1])
+
+                def format_scrobbles(page):
+                    page["Listened at"] = ingest.listened_at(page["uts"], TIMEZONE).dt.strftime("%d %b %Y, %H:%M %Z")
+                    return page.drop(columns="uts")
+
+                st.markdown(f"### Your Recently Played, {date_range[0]} to {date_range[-1]}")
+                st.bar_chart(data_layer.daily_play_counts("scrobbles", LASTFM_USER, start, end), y_label="Scrobbles")
+                grid.paged("lastfm_recently_played",
+                           lambda *page: data_layer.scrobbles_page(LASTFM_USER, start, end, *page),
+                           sortable={"Listened at": "uts", "Track": "Track",
+                                     "Artist": "Artist", "Album": "Album"},
+                           format=format_scrobbles,
+                           scope=(start, end),
+                           bold="Track")
+
+        lazy_tabs.render({"Top Tracks": render_top_this_week,
+                          "Recently Played": render_recently_played},
+                         key="this_week_tab")
+
+    def render_top_tracks():
 
         col1, col2 = st.columns([1.5, 1])
         with col1:
             period = st.selectbox("Select time period",
                                   options=long_periods)
             
-            r = lastfm_get({'method': 'user.getTopTracks', 
-                            'user': "jasminexx18",
-                            'period': PERIOD_MAPPING[period]})
-            week_tracks = r.json()["toptracks"]
+            week_tracks = data_layer.lastfm_top_tracks(LASTFM_USER, PERIOD_MAPPING[period])
 
             # with ThreadPoolExecutor(max_workers=2) as executor: 
             #     results = executor.map(process_track, [track for track in week_tracks["track"] if int(track["playcount"]) > 2])
-            all_week_tracks = pd.DataFrame([process_track(track) for track in week_tracks["track"]])
+            all_week_tracks = ingest.top_tracks_to_frame(week_tracks)
+
+            # top-track entries mostly carry their length already; track.getInfo fills in the rest, cached
+            pairs = list(zip(all_week_tracks["Track"], all_week_tracks["Artist"]))
+            track_durations = data_layer.top_tracks_durations(LASTFM_USER, PERIOD_MAPPING[period], pairs,
+                                                              dict(zip(pairs, all_week_tracks["Duration"])))
+            all_week_tracks["Duration"] = [track_durations[pair] for pair in pairs]
+
+            # swap last.fm's placeholder art for the cover art archive thumbnail where we have an mbid;
+            # MusicBrainz allows one lookup a second, so uncached covers are resolved in the background
+            # (or by the sync worker) and show the fallback image until a later rerun picks them up
+            covers = coverart.get_coverart(all_week_tracks["mbid"], fetch_misses=False)
+            missing_covers = coverart.uncached(all_week_tracks["mbid"])
+            if missing_covers:
+                lazy_tabs.deferred(("coverart", tuple(missing_covers)), coverart.get_coverart, missing_covers)
+            all_week_tracks["track_image"] = thumbnails.data_uris(covers.get(mbid, image) for mbid, image
+                                                                  in zip(all_week_tracks["mbid"], all_week_tracks["track_image"]))
+            all_week_tracks = all_week_tracks.drop(columns="mbid")
 
             st.markdown(f"### Your Top Tracks: {period}")
-            builder = GridOptionsBuilder.from_dataframe(all_week_tracks)
-            builder.configure_column("Track",
-                                     cellStyle={"fontWeight": "bold"})  
-            
-            builder.configure_grid_options(rowHeight=50, suppressColumnVirtualisation=True) 
-            # builder.configure_grid_options(onFirstDataRendered="function() { gridOptions.api.sizeColumnsToFit(); }")
-
-            options = builder.build()
-            
-            # custom_css = {
-            #     ".ag-root.ag-unselectable.ag-layout-normal": {
-            #         "font-family": "Outfit, sans-serif !important;"
-            #     },
-            #     ".ag-header-cell-text": {
-            #         "font-family": "Outfit, sans-serif !important;",
-            #         "font-weight": "bolder !important;", 
-            #         "font-size": "larger !important;"
-            #     }
-            # }
-
-            grid = AgGrid(all_week_tracks, 
-                        gridOptions=options,
-                        columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS,
-                        # custom_css=custom_css,
-                        allow_unsafe_jscode=True, 
-                        theme=AgGridTheme.ALPINE,
-                        height=800,
-                        )
+            top_tracks_grid = all_week_tracks.drop(columns="Duration")
+            grid.show(top_tracks_grid,
+                      grid.options(top_tracks_grid, bold="Track", image_column="track_image",
+                                   image_size=45, image_width=80))
         with col2: 
             st.markdown("### ")
             st.markdown("### ")
-            artist_counts = all_week_tracks.value_counts().reset_index()
+            artist_counts = all_week_tracks["Artist"].value_counts().loc[lambda counts: counts > 0].reset_index()
             labels = artist_counts["Artist"]
             values = artist_counts["count"]
 
@@ -495,15 +307,58 @@ else:
             fig.update_layout(title = "Artist Representation")
             st.plotly_chart(fig, use_container_width=True)
 
-            # durations = all_week_tracks["Duration"].astype(int) / 60
-            # durations_hist = go.Figure(data=[go.Histogram(x=durations, 
-            #                                               xbins=dict(start=min(durations), end=max(durations), size=1))])
-            # durations_hist.update_layout(title = "Distribution of Track Durations", 
-            #                              hovermode='x unified')
-            # st.plotly_chart(durations_hist, use_container_width=True)
+            # no plays in the period, no durations to bin
+            if not all_week_tracks.empty:
+                minutes = all_week_tracks["Duration"].astype(int) / 60
+                durations_hist = go.Figure(data=[go.Histogram(x=minutes, 
+                                                              xbins=dict(start=min(minutes), end=max(minutes), size=1))])
+                durations_hist.update_layout(title = "Distribution of Track Durations", 
+                                             hovermode='x unified')
+                st.plotly_chart(durations_hist, use_container_width=True)
+            hours = (all_week_tracks["Streams"] * all_week_tracks["Duration"]).sum() / 3600
+            st.caption(f"About {hours:,.1f} hours listened across these tracks")
             # extra stats maybe 
             # st.markdown(f"#### Additional Stats")
             # st.markdown(f"{len(all_week_tracks['Artist'].unique())} unique artists are represented")
 
             # artists weighted by rank or # of streams?
 
+    def render_trends():
+
+        col1, col2, col3 = st.columns(3)
+        today = datetime.now(TIMEZONE).date()
+        date_range = col1.date_input("Date range",
+                                     value=(today - timedelta(days=90), today),
+                                     max_value=today,
+                                     format="MM/DD/YYYY",
+                                     key="trend_range")
+        start, end = range_index.date_range_bounds(date_range[0], date_range[-1])
+        bin = col2.radio("Plays per", ["day", "hour"], horizontal=True, key="trend_bin")
+        kind = col3.selectbox("Trend of", ["All plays", "Artists", "Tracks", "Tags"], key="trend_kind")
+
+        options = data_layer.trend_options(LASTFM_USER, kind, start, end)
+        if kind == "All plays":
+            selected = {"All plays": None}
+        else:
+            labels = st.multiselect(kind, list(options), default=list(options)[:3], key=f"trend_{kind}")
+            selected = {label: options[label] for label in labels}
+
+        # each line is downsampled to the chart's width before it's sent to the browser
+        fig = go.Figure()
+        for label, name in selected.items():
+            trend = data_layer.trend_series(LASTFM_USER, bin, start, end, kind, name)
+            fig.add_trace(go.Scatter(x=trend.index, y=trend.values, mode="lines", name=label))
+
+        fig.update_layout(title=f"Plays per {bin}, {date_range[0]} to {date_range[-1]}",
+                          hovermode="x unified")
+        st.plotly_chart(fig, use_container_width=True)
+
+    # can change the tab options - keeping it this for now
+    lazy_tabs.render({"Summary": lambda: summary.render(LASTFM_USER, MONDAY),
+                      "This Week": render_this_week,
+                      "Top Artists": lambda: top_artists.render(LASTFM_USER, PERIOD_MAPPING),
+                      "Top Tracks": render_top_tracks,
+                      "Trends": render_trends},
+                     key="lastfm_tab")
+
+metrics.render_debug_panel()
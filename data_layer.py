@@ -0,0 +1,501 @@
+import copy
+import functools
+import hashlib
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import pandas as pd
+
+import durations
+import metrics
+import range_index
+import scrobble_store
+import snapshot
+import spotify_history
+import sync_scheduler
+import sync_worker
+import tag_cloud
+import tags
+import thumbnails
+import trends
+from lastfm_client import lastfm_get
+from rate_limit import LASTFM_LIMITER
+
+### CONSTANTS ###
+MINUTE = 60
+HOUR = 60 * MINUTE
+
+SPOTIFY_TIME_RANGES = ["short_term", "medium_term", "long_term"]
+# how far back each last.fm period reaches, in days (None: everything)
+PERIOD_DAYS = {"7day": 7, "1month": 30, "3month": 90, "6month": 180, "12month": 365, "overall": None}
+
+### CLASSES ###
+class Memo:
+    """Process-wide TTL memo keyed by (user, method, period, week_start, inputs digest)
+
+    Streamlit imports this module once per server process, so entries survive
+    reruns and are shared between sessions; keying on `user` keeps listeners apart.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, ttl, compute):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                return entry[1]
+            key_lock = self._locks.setdefault(key, threading.Lock())
+
+        # one computation per key; concurrent sessions asking for the same key wait on it
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > time.time():
+                    return entry[1]
+
+            value = compute()
+
+            with self._lock:
+                self._entries[key] = (time.time() + ttl, value)
+                self._prune()
+
+        return value
+
+    def _prune(self):
+        """Drops expired entries, and the per-key locks nobody is holding (call with _lock held)
+
+        Keys include `week_start`, so without this every past week and every user
+        who ever visited would stay in memory for the life of the process.
+        """
+
+        now = time.time()
+        for key in [key for key, (expires, _) in self._entries.items() if expires <= now]:
+            del self._entries[key]
+        for key in [key for key, lock in self._locks.items() if key not in self._entries and not lock.locked()]:
+            del self._locks[key]
+
+    def invalidate(self, user=None, method=None):
+        """Drops every entry matching the given user and/or method (everything if neither)"""
+
+        with self._lock:
+            for key in list(self._entries):
+                if (user is None or key[0] == user) and (method is None or key[1] == method):
+                    del self._entries[key]
+
+MEMO = Memo()
+
+### FUNCTIONS ###
+def _digest(values):
+    return hashlib.sha1(repr(values).encode()).hexdigest()
+
+def memoized(method, ttl, inputs=()):
+    """Memoizes a data-layer function on its `user`, `period` and `week_start` arguments
+
+    Other arguments (API clients and the like) aren't part of the key, except those
+    named in `inputs` - data the result is computed from, like this week's pairs -
+    which are keyed by digest. Callers get a deep copy of the cached value, so mutating
+    a returned DataFrame - even one inside a dict, like listening_stats' "daily" - can't
+    poison the memo.
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (bound.arguments.get("user"),
+                   method,
+                   bound.arguments.get("period"),
+                   bound.arguments.get("week_start"),
+                   _digest([bound.arguments[name] for name in inputs]) if inputs else None)
+
+            def compute():
+                metrics.inc("data_memo_misses_total", method=method)
+                with metrics.timer("data_seconds", method=method):
+                    return func(*args, **kwargs)
+
+            metrics.inc("data_memo_requests_total", method=method)
+            value = MEMO.get_or_compute(key, ttl, compute)
+
+            return copy.deepcopy(value)
+
+        return wrapper
+
+    return decorator
+
+def invalidate(user=None, method=None):
+    MEMO.invalidate(user=user, method=method)
+
+def start_metrics_server():
+    """Exposes this process's metrics on METRICS_PORT, if one is configured"""
+
+    metrics.serve()
+
+@functools.lru_cache(maxsize=None)
+def get_store():
+    """One scrobble store connection shared across reruns and sessions"""
+
+    return scrobble_store.connect()
+
+@functools.lru_cache(maxsize=None)
+def get_scheduler():
+    """The process's background sync scheduler, started on first use
+
+    It stands by while an out-of-process sync worker is live, so a worker that
+    comes back doesn't end up sharing the last.fm budget with this process.
+    """
+
+    return sync_scheduler.SyncScheduler(get_store(), lastfm_get, standby=worker_is_live).start()
+
+def worker_is_live():
+    """Whether an out-of-process sync worker is keeping the store warm"""
+
+    return sync_worker.worker_is_live(get_store())
+
+def mark_active(user):
+    """Dashboard heartbeat: puts the user at the front of whichever scheduler is syncing"""
+
+    scrobble_store.mark_active(get_store(), user)
+
+    if not worker_is_live():
+        get_scheduler().mark_active(user)
+
+def last_synced(user):
+    """Epoch seconds of the user's last completed scrobble sync (None if never)"""
+
+    return scrobble_store.last_synced(get_store(), user, "recent_tracks")
+
+@memoized("user.getRecentTracks", ttl=MINUTE)
+def sync_scrobbles(user, week_start):
+    """Pulls the delta since the last stored scrobble; returns how many were new
+
+    Skipped while the sync worker is live - it already keeps the store current.
+    """
+
+    if worker_is_live():
+        return 0
+
+    inserted, _ = scrobble_store.sync_recent_tracks(get_store(), lastfm_get, user, week_start.timestamp())
+
+    return inserted
+
+def get_snapshot(user):
+    """The user's memory-mapped rollup snapshot (None until the sync worker has written one)
+
+    Mapped once per written snapshot and shared by every session in the process.
+    """
+
+    return snapshot.open_snapshot(user)
+
+def _plays_between(user, table, start_day, end_day=None):
+    """Plays per track or artist over TIMEZONE days [start_day, end_day], most played first
+
+    `table` picks the rollup, and the frame is shaped like the store's *_between one.
+    Days the snapshot holds in full are summed from the mapped rollup; the store is
+    only asked for the rest, from the snapshot's last (possibly partial) day on.
+    """
+
+    conn = get_store()
+    read = (scrobble_store.top_tracks_between if table == "daily_track_plays"
+            else scrobble_store.artist_plays_between)
+
+    mapped = get_snapshot(user)
+    if mapped is None or mapped.partial_from <= str(start_day):
+        return read(conn, user, start_day, end_day)
+
+    keys, plays = snapshot.TOTALS[table]
+    frame = (pd.concat([snapshot.totals(mapped.rollup_between(table, start_day, end_day), table),
+                        read(conn, user, mapped.partial_from, end_day).drop(columns="Rank", errors="ignore")])
+             .groupby(keys, as_index=False, dropna=False)[plays].sum()
+             .sort_values([plays, keys[0]], ascending=[False, True], ignore_index=True))
+
+    if table == "daily_track_plays":
+        frame.insert(0, "Rank", range(1, frame.shape[0] + 1))
+
+    return frame
+
+@memoized("daily_track_plays", ttl=MINUTE)
+def week_top_tracks(user, week_start):
+    """Ranked track plays since `week_start`, summed from the daily rollups"""
+
+    sync_scrobbles(user, week_start)
+
+    return _plays_between(user, "daily_track_plays", week_start.date())
+
+@memoized("daily_artist_plays", ttl=MINUTE)
+def week_artist_plays(user, week_start):
+    """Plays per artist since `week_start`, summed from the daily rollups"""
+
+    sync_scrobbles(user, week_start)
+
+    return _plays_between(user, "daily_artist_plays", week_start.date())
+
+@memoized("daily_stats", ttl=MINUTE)
+def listening_stats(user, week_start):
+    """Today's, this week's and all-time listening stats, plus the week's daily breakdown
+
+    Everything is read from the stats kept up to date at ingest; all-time distinct
+    counts are HyperLogLog estimates.
+    """
+
+    sync_scrobbles(user, week_start)
+    conn = get_store()
+    today = scrobble_store.local_day(time.time())
+
+    return {"today": scrobble_store.stats_between(conn, user, today, today),
+            "week": scrobble_store.stats_between(conn, user, week_start.date()),
+            "all_time": scrobble_store.stats_between(conn, user, None, approximate=True),
+            "daily": scrobble_store.daily_stats(conn, user, week_start.date())}
+
+def stored_since(user):
+    """TIMEZONE day of the user's oldest stored scrobble (None if nothing is stored)
+
+    Without a backfill that's the week of the first sync, not the start of their history.
+    """
+
+    first = scrobble_store.low_water_mark(get_store(), user)
+
+    return None if first is None else scrobble_store.local_day(first)
+
+def period_start(period):
+    """First TIMEZONE day of a last.fm period ("7day", ..., "overall") ending today"""
+
+    days = PERIOD_DAYS[period]
+
+    return scrobble_store.local_day(time.time() - (days - 1) * 24 * 60 * 60) if days else "0000-00-00"
+
+@memoized("artist_plays", ttl=MINUTE)
+def top_artists(user, period):
+    """Ranked plays per artist over a last.fm period, counted from the stored scrobbles"""
+
+    sync_scrobbles(user, scrobble_store.week_start())
+    artists = _plays_between(user, "daily_artist_plays", period_start(period)).rename(columns={"count": "Streams"})
+    artists.insert(0, "Rank", range(1, artists.shape[0] + 1))
+
+    return artists
+
+def _tagged_artists(user, start, end):
+    """{artist: cached tags} for every artist played in [start, end)
+
+    Only the tag cache is consulted - a multi-year range can span thousands of
+    artists, far too many to look up inline; the worker fills the cache over time.
+    """
+
+    artists = _plays_between(user, "daily_artist_plays", scrobble_store.local_day(start.timestamp()),
+                             scrobble_store.local_day(end.timestamp() - 1))
+
+    return artists, tags.get_artists_top_tags(lastfm_get, artists["Artist"], fetch_misses=False)
+
+def trend_options(user, kind, start, end, limit=50):
+    """{label: trend_series name} of the most played artists, tracks or tags in [start, end)"""
+
+    start_day = scrobble_store.local_day(start.timestamp())
+    end_day = scrobble_store.local_day(end.timestamp() - 1)
+
+    if kind == "Artists":
+        artists = _plays_between(user, "daily_artist_plays", start_day, end_day).head(limit)
+        return dict(zip(artists["Artist"], artists["Artist"]))
+    if kind == "Tracks":
+        tracks = _plays_between(user, "daily_track_plays", start_day, end_day).head(limit)
+        return {f"{track} - {artist}": (track, artist) for track, artist in zip(tracks["Track"], tracks["Artist"])}
+    if kind == "Tags":
+        artists, artist_tags = _tagged_artists(user, start, end)
+        frequencies = tag_cloud.tag_frequencies(artist_tags, artists["Artist"].tolist(), artists["count"].tolist())
+        return {tag: tag for tag in sorted(frequencies, key=frequencies.get, reverse=True)[:limit]}
+
+    return {}
+
+def trend_series(user, bin, start, end, kind, name=None):
+    """Downsampled plays per `bin` over [start, end) for all plays, an artist, a (track, artist) or a tag
+
+    Read from the hourly/daily rollups; a tag's series sums the artists whose
+    (cached) top tags include it.
+    """
+
+    sync_scrobbles(user, scrobble_store.week_start())
+    filters = {}
+
+    if kind == "Artists":
+        filters = {"artist": name}
+    elif kind == "Tracks":
+        filters = {"track": name[0], "artist": name[1]}
+    elif kind == "Tags":
+        _, artist_tags = _tagged_artists(user, start, end)
+        filters = {"artists": [artist for artist, tag_names in artist_tags.items() if name in tag_names]}
+
+    return trends.trend(get_store(), user, bin, start, end, **filters)
+
+@memoized("user.getTopTracks", ttl=HOUR)
+def lastfm_top_tracks(user, period):
+    """Raw user.getTopTracks entries for a last.fm period ("7day", "1month", ...)"""
+
+    stored = scrobble_store.load_top_tracks(get_store(), user, period)
+    if stored is not None and worker_is_live():
+        return stored
+
+    LASTFM_LIMITER.acquire()
+    r = lastfm_get({'method': 'user.getTopTracks',
+                    'user': user,
+                    'period': period})
+
+    return r.json()["toptracks"]["track"]
+
+@memoized("track.getInfo", ttl=HOUR, inputs=("pairs",))
+def top_tracks_durations(user, period, pairs, known=None):
+    """{(track, artist): seconds} for a period's top tracks, DEFAULT_TRACK_SECONDS where unknown
+
+    Memoized per list of pairs, so a refreshed top-tracks list gets its own durations.
+    """
+
+    return durations.with_default(durations.get_track_durations(lastfm_get, pairs, known=known,
+                                                                fetch_misses=not worker_is_live()))
+
+@memoized("track.getTopTags", ttl=10 * MINUTE, inputs=("pairs", "streams"))
+def week_tag_frequencies(user, week_start, pairs, streams=None):
+    """{tag: weight} over the week's (track, artist) pairs, weighted by `streams` if given"""
+
+    # the worker resolves misses in the background; the page just shows what's cached
+    track_tags = tags.get_tracks_top_tags(lastfm_get, pairs, fetch_misses=not worker_is_live())
+
+    return tag_cloud.tag_frequencies(track_tags, pairs, streams)
+
+@memoized("artist.getTopTags", ttl=10 * MINUTE, inputs=("pairs", "streams"))
+def week_artist_tag_frequencies(user, week_start, pairs, streams):
+    """{tag: weight} resolved once per artist, weighted by each artist's streams"""
+
+    return tags.artist_tag_frequencies(lastfm_get, pairs, streams, fetch_misses=not worker_is_live())
+
+@memoized("spotify.current_user_top_artists", ttl=10 * MINUTE)
+def spotify_top_artists(spotify, user, period):
+    """A user's top 50 Spotify artists for a time range ("short_term", ...)"""
+
+    top_artists = []
+
+    for i, item in enumerate(spotify.current_user_top_artists(limit=50, time_range=period)["items"]):
+
+        artist_info = {
+            "rank": i + 1,
+            "name": item["name"],
+            "uri": item["uri"],
+            "genres": ', '.join(item["genres"]),
+            "popularity": item["popularity"],
+            "followers": item["followers"]["total"],
+            "image_url": item["images"][1]["url"]
+        }
+
+        top_artists.append(artist_info)
+
+    top_artists = pd.DataFrame(top_artists)
+    # 64px local thumbnails instead of the medium-size remote images
+    top_artists["image_url"] = thumbnails.data_uris(top_artists["image_url"])
+
+    return top_artists
+
+@memoized("spotify.current_user_top_tracks", ttl=10 * MINUTE)
+def spotify_top_tracks(spotify, user, period):
+    """A user's top 50 Spotify tracks for a time range ("short_term", ...)"""
+
+    top_tracks = []
+
+    for i, item in enumerate(spotify.current_user_top_tracks(limit=50, time_range=period)["items"]):
+        track_info = {
+            "rank": i + 1,
+            "name": item["name"],
+            "artists": ", ".join([art["name"] for art in item["artists"]]),
+            "album": item["album"]["name"],
+            "uri": item["uri"],
+            "image_url": item["album"]["images"][1]["url"],
+            "popularity": item["popularity"]
+        }
+
+        top_tracks.append(track_info)
+
+    top_tracks = pd.DataFrame(top_tracks)
+    top_tracks["image_url"] = thumbnails.data_uris(top_tracks["image_url"])
+
+    return top_tracks
+
+@memoized("spotify.current_user_recently_played", ttl=MINUTE)
+def sync_spotify_plays(spotify, user):
+    """Pulls Spotify plays newer than the last stored one; returns how many were new"""
+
+    return spotify_history.sync_recently_played(spotify, get_store(), user)
+
+@functools.lru_cache(maxsize=None)
+def _range_index(table, user):
+    return range_index.RangeIndex(table, user)
+
+def get_range_index(table, user):
+    """The user's range index over `table`, caught up with the store
+
+    While the sync worker is live it keeps the scrobble indexes current and this only
+    maps what it wrote; Spotify plays are accumulated in this process, so their index
+    is always refreshed here.
+    """
+
+    index = _range_index(table, user)
+
+    if table == "scrobbles" and worker_is_live():
+        index.load()
+    else:
+        index.refresh(get_store())
+
+    return index
+
+def _plays_page(table, user, start, end, offset, limit, sort, descending, search):
+    index = get_range_index(table, user)
+
+    # time-ordered pages are slices of the index; anything else is left to SQL over the range
+    if not search and sort in (None, index.time_column):
+        rowids = index.rowids_between(start, end, offset, limit, descending)
+        return scrobble_store.read_rows(get_store(), table, rowids), index.count(start, end)
+
+    return scrobble_store.read_page(get_store(), table, user, offset, limit,
+                                    since=index.to_units(start) or 0, until=index.to_units(end),
+                                    sort=sort, descending=descending, search=search)
+
+def scrobbles_page(user, start, end, offset, limit, sort=None, descending=True, search=None):
+    """(page, matching rows) of stored scrobbles in [start, end) - tz-aware, None for open-ended
+
+    Not memoized: a page is a couple of binary searches and a rowid lookup, and caching
+    every (range, offset, sort, search) combination would only hold the history in memory again.
+    """
+
+    return _plays_page("scrobbles", user, start, end, offset, limit, sort, descending, search)
+
+def spotify_plays_page(spotify, user, start, end, offset, limit, sort=None, descending=True, search=None):
+    """(page, matching rows) of a user's accumulated Spotify plays in [start, end), `played_at` in epoch ms"""
+
+    sync_spotify_plays(spotify, user)
+
+    return _plays_page("spotify_plays", user, start, end, offset, limit, sort, descending, search)
+
+def daily_play_counts(table, user, start, end):
+    """Plays per TIMEZONE day in [start, end), straight from the range index"""
+
+    return get_range_index(table, user).daily_counts(start, end)
+
+def spotify_prefetch(spotify, user):
+    """Warms every Spotify tab in one concurrent batch
+
+    All three time ranges of top artists and top tracks plus recently played are
+    requested at once, so switching tabs or time frames is a memo hit. Entries
+    already memoized cost nothing.
+    """
+
+    calls = ([(spotify_top_artists, period) for period in SPOTIFY_TIME_RANGES]
+             + [(spotify_top_tracks, period) for period in SPOTIFY_TIME_RANGES])
+
+    with ThreadPoolExecutor(max_workers=len(calls) + 1) as executor:
+        futures = [executor.submit(func, spotify, user, period) for func, period in calls]
+        futures.append(executor.submit(sync_spotify_plays, spotify, user))
+
+        for future in futures:
+            future.result()
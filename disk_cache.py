@@ -0,0 +1,119 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+### ENV. VARIABLES ###
+CACHE_PATH = os.getenv("CACHE_PATH", "cache.db")
+
+### CONSTANTS ###
+MAX_WORKERS = 4
+
+### CLASSES ###
+class DiskCache:
+    """Persistent key/value cache with a TTL, LRU eviction and negative entries
+
+    Values are stored as JSON in one SQLite table per namespace. Storing `None`
+    records a negative entry (\"looked it up, nothing there\") which expires after
+    `negative_ttl` instead of `ttl`, so misses aren't re-requested on every rerun
+    but do get retried eventually.
+    """
+
+    def __init__(self, namespace, ttl, max_entries, negative_ttl=None, path=CACHE_PATH):
+        self.table = f"cache_{namespace}"
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                           "key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)")
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_accessed "
+                           f"ON {self.table} (accessed)")
+
+    def get_many(self, keys):
+        """Returns {key: value} for every unexpired key (negative entries map to None)"""
+
+        keys = list(set(keys))
+        now = time.time()
+        hits = {}
+
+        with self._lock:
+            # stay well under SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                marks = ", ".join("?" * len(chunk))
+                rows = self._conn.execute(f"SELECT key, value FROM {self.table} "
+                                          f"WHERE key IN ({marks}) AND expires > ?",
+                                          (*chunk, now)).fetchall()
+                hits.update((key, json.loads(value)) for key, value in rows)
+
+            with self._conn:
+                self._conn.executemany(f"UPDATE {self.table} SET accessed = ? WHERE key = ?",
+                                       [(now, key) for key in hits])
+
+        return hits
+
+    def set_many(self, items):
+        """Stores {key: value}; a value of None is stored as a negative entry"""
+
+        now = time.time()
+        rows = [(key,
+                 json.dumps(value),
+                 now + (self.negative_ttl if value is None else self.ttl),
+                 now)
+                for key, value in items.items()]
+
+        with self._lock, self._conn:
+            self._conn.executemany(f"INSERT OR REPLACE INTO {self.table} "
+                                   "(key, value, expires, accessed) VALUES (?, ?, ?, ?)", rows)
+            self._evict()
+
+    def _evict(self):
+        """Drops expired entries, then the least recently used ones beyond max_entries"""
+
+        self._conn.execute(f"DELETE FROM {self.table} WHERE expires <= ?", (time.time(),))
+        self._conn.execute(f"DELETE FROM {self.table} WHERE key IN ("
+                           f"SELECT key FROM {self.table} ORDER BY accessed DESC "
+                           "LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def lookup(self, keys, fetch, fetch_misses=True, max_workers=MAX_WORKERS):
+        """Returns {item: cached value or None} for every item in `keys` ({item: cache key})
+
+        Misses are fetched with `fetch(item)` concurrently, once per distinct cache key,
+        and stored - a None result as a negative entry. A fetch that raises is logged
+        and left uncached, so it's retried next time rather than remembered as "nothing
+        there". With `fetch_misses=False` nothing is fetched and misses come back None.
+        """
+
+        cached = self.get_many(keys.values())
+        # one fetch per key, even if the spelling differs between items
+        misses = list({keys[item]: item for item in keys if keys[item] not in cached}.values())
+        if not fetch_misses:
+            misses = []
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(lambda item: _resolve(fetch, item), misses))
+
+        resolved = {keys[item]: value for item, (ok, value) in zip(misses, results) if ok}
+        self.set_many(resolved)
+        cached.update(resolved)
+
+        return {item: cached.get(keys[item]) for item in keys}
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+### FUNCTIONS ###
+def _resolve(fetch, item):
+    """(True, fetch(item)), or (False, None) if it raised"""
+
+    try:
+        return True, fetch(item)
+    except Exception as e:
+        print(f"Error fetching {item}: {e}")
+        return False, None
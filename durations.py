@@ -0,0 +1,56 @@
+import scrobble_store
+from disk_cache import DiskCache
+from rate_limit import LASTFM_LIMITER
+from tags import normalize_key
+
+### CONSTANTS ###
+DAY = 24 * 60 * 60
+# a track's length doesn't change; last.fm does sometimes learn an unknown one
+DURATION_TTL = 180 * DAY
+NO_DURATION_TTL = 7 * DAY
+MAX_ENTRIES = 100_000
+MAX_WORKERS = 4
+
+# last.fm error 6: "Track not found"
+NOT_FOUND = 6
+
+DURATIONS = DiskCache("track_durations", DURATION_TTL, MAX_ENTRIES, negative_ttl=NO_DURATION_TTL)
+
+### FUNCTIONS ###
+def get_track_duration(lastfm_get, track, artist):
+    """Fetches a track's length in seconds via track.getInfo (None if last.fm doesn't know it)"""
+
+    LASTFM_LIMITER.acquire()
+    r = lastfm_get({'method': 'track.getInfo',
+                    'artist': artist,
+                    'track': track})
+    data = r.json()
+
+    if data.get("error") == NOT_FOUND:
+        return None
+
+    # milliseconds, with 0 meaning unknown
+    return int(data["track"].get("duration") or 0) // 1000 or None
+
+def get_track_durations(lastfm_get, pairs, known=None, fetch_misses=True):
+    """Returns {(track, artist): seconds or None}, one track.getInfo per uncached track
+
+    Pairs are deduplicated by normalized identity and misses resolved concurrently
+    under LASTFM_LIMITER. `known` ({pair: seconds}) are durations already at hand -
+    user.getTopTracks carries most of them - and are cached without a request. Tracks
+    last.fm has no length for are cached as negative entries until NO_DURATION_TTL.
+    """
+
+    keys = {pair: normalize_key(pair[1], pair[0]) for pair in pairs}
+
+    if known:
+        DURATIONS.set_many({normalize_key(pair[1], pair[0]): int(seconds)
+                            for pair, seconds in known.items() if seconds and int(seconds)})
+
+    return DURATIONS.lookup(keys, lambda pair: get_track_duration(lastfm_get, *pair), fetch_misses,
+                            max_workers=MAX_WORKERS)
+
+def with_default(durations):
+    """Durations with the store's typical track length standing in for unknown tracks"""
+
+    return {pair: seconds or scrobble_store.DEFAULT_TRACK_SECONDS for pair, seconds in durations.items()}
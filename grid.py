@@ -0,0 +1,128 @@
+import copy
+import functools
+
+import pandas as pd
+import streamlit as st
+from st_aggrid import AgGrid, JsCode, ColumnsAutoSizeMode, AgGridTheme
+from st_aggrid.grid_options_builder import GridOptionsBuilder
+
+import metrics
+
+### CONSTANTS ###
+HEIGHT = 800
+PAGE_SIZES = [50, 100, 250]
+DEFAULT_PAGE_SIZE = 100
+
+### FUNCTIONS ###
+@functools.lru_cache(maxsize=None)
+def image_renderer(size):
+    """AgGrid cell renderer drawing the cell's URL as a `size`px square image"""
+
+    return JsCode(f"""
+        class UrlCellRenderer {{
+        init(params) {{
+            this.eGui = document.createElement('img');
+            this.eGui.setAttribute('src', params.value);
+            this.eGui.setAttribute('style', "width:{size}px;height:{size}px");
+        }}
+        getGui() {{
+            return this.eGui;
+        }}
+        }}""")
+
+@functools.lru_cache(maxsize=128)
+def _build_options(dtypes, row_height, image_column, image_size, image_width, bold, max_widths, fit_columns):
+    builder = GridOptionsBuilder.from_dataframe(pd.DataFrame({column: pd.Series(dtype=dtype)
+                                                              for column, dtype in dtypes}))
+
+    if bold is not None:
+        builder.configure_column(bold, cellStyle={"fontWeight": "bold"})
+
+    for column, width in max_widths:
+        builder.configure_column(column, maxWidth=width)
+
+    # allows for artist/album images to be displayed in the grid
+    if image_column is not None:
+        builder.configure_column(image_column,
+                                 headerName="",
+                                 width=image_width or image_size + 35,
+                                 cellRenderer=image_renderer(image_size))
+
+    builder.configure_grid_options(rowHeight=row_height, suppressColumnVirtualisation=True)
+    if fit_columns:
+        builder.configure_grid_options(onFirstDataRendered="function() { gridOptions.api.sizeColumnsToFit(); }")
+
+    return builder.build()
+
+def options(frame, row_height=50, image_column=None, image_size=65, image_width=None,
+            bold=None, max_widths=None, fit_columns=False):
+    """Grid options for `frame`, built once per column layout and reused across reruns"""
+
+    dtypes = tuple((column, str(dtype)) for column, dtype in frame.dtypes.items())
+    max_widths = tuple(sorted((max_widths or {}).items()))
+
+    # AgGrid is handed its own copy, so the cached options never pick up per-render state
+    return copy.deepcopy(_build_options(dtypes, row_height, image_column, image_size,
+                                        image_width, bold, max_widths, fit_columns))
+
+def show(frame, grid_options, height=HEIGHT, auto_size=ColumnsAutoSizeMode.FIT_CONTENTS, key=None):
+    """Draws `frame` with the repo's AgGrid defaults"""
+
+    metrics.inc("grid_rows_total", len(frame))
+
+    with metrics.timer("render_seconds", part="grid"):
+        return AgGrid(frame,
+                      gridOptions=grid_options,
+                      columns_auto_size_mode=auto_size,
+                      allow_unsafe_jscode=True,
+                      theme=AgGridTheme.ALPINE,
+                      height=height,
+                      key=key)
+
+def paged(key, fetch, sortable, format=None, scope=None, height=HEIGHT, **option_kwargs):
+    """Shows a large table one page at a time
+
+    `fetch(offset, limit, sort, descending, search)` returns (page frame, matching row
+    count). `sortable` maps the labels offered in "Sort by" to the `sort` keys handed to
+    `fetch`, and the search box is passed through as `search`, so ordering and filtering
+    run in the store's query - the browser only ever receives one page, however much
+    history there is. `format` turns a fetched page into the frame that's displayed, and
+    `scope` is anything else the rows depend on (e.g. a date range).
+    """
+
+    col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
+    search = col1.text_input("Search", key=f"{key}_search", placeholder="Track, artist or album")
+    sort_label = col2.selectbox("Sort by", list(sortable), key=f"{key}_sort")
+    order = col3.selectbox("Order", ["Descending", "Ascending"], key=f"{key}_order")
+    page_size = col4.selectbox("Rows per page", PAGE_SIZES,
+                               index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE), key=f"{key}_page_size")
+
+    # a new search, ordering or scope starts back at the first page
+    page_key = f"{key}_page"
+    query = (search, sort_label, order, page_size, scope)
+    if st.session_state.get(f"{key}_query") != query:
+        st.session_state[f"{key}_query"] = query
+        st.session_state[page_key] = 1
+
+    def fetch_page(page):
+        with metrics.timer("grid_page_seconds", grid=key):
+            return fetch((page - 1) * page_size, page_size, sortable[sort_label], order == "Descending", search)
+
+    page = st.session_state.get(page_key, 1)
+    frame, total = fetch_page(page)
+    pages = max(1, -(-total // page_size))
+
+    # the table can shrink under a stale page number (e.g. a narrower search)
+    if page > pages:
+        page = st.session_state[page_key] = pages
+        frame, total = fetch_page(page)
+
+    offset = (page - 1) * page_size
+    if format is not None:
+        frame = format(frame)
+
+    show(frame, options(frame, **option_kwargs), height=height, key=f"{key}_grid")
+
+    col1, col2 = st.columns([1, 4])
+    col1.number_input("Page", min_value=1, max_value=pages, step=1, key=page_key)
+    col2.caption(f"Rows {offset + 1 if total else 0:,}-{offset + len(frame):,} of {total:,}")
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+### CONSTANTS ###
+# scrobble frames: dictionary-encoded strings plus the raw epoch, no per-row dicts
+CATEGORICAL_COLUMNS = ["Track", "Artist", "Album"]
+SCROBBLE_COLUMNS = CATEGORICAL_COLUMNS + ["uts"]
+
+TOP_TRACK_COLUMNS = ["Rank", "track_image", "mbid", "Track", "Artist", "Streams", "Duration"]
+
+### CLASSES ###
+class ScrobbleColumns:
+    """Accumulates user.getRecentTracks pages as column chunks"""
+
+    def __init__(self):
+        self._chunks = {column: [] for column in SCROBBLE_COLUMNS}
+
+    def append(self, columns):
+        for column in SCROBBLE_COLUMNS:
+            self._chunks[column].append(columns[column])
+
+    def columns(self):
+        return {"Track": [value for chunk in self._chunks["Track"] for value in chunk],
+                "Artist": [value for chunk in self._chunks["Artist"] for value in chunk],
+                "Album": [value for chunk in self._chunks["Album"] for value in chunk],
+                "uts": np.concatenate(self._chunks["uts"]) if self._chunks["uts"] else np.empty(0, np.int64)}
+
+    def to_frame(self):
+        return columns_to_frame(self.columns())
+
+### FUNCTIONS ###
+def recent_tracks_to_columns(tracks):
+    """Splits a user.getRecentTracks page into columns, dropping the now-playing entry"""
+
+    played = [track for track in tracks if "@attr" not in track]
+
+    return {"Track": [track["name"] for track in played],
+            "Artist": [track["artist"]["#text"] for track in played],
+            "Album": [track["album"]["#text"] for track in played],
+            "uts": np.fromiter((track["date"]["uts"] for track in played), dtype=np.int64, count=len(played))}
+
+def columns_to_frame(columns):
+    """Builds a scrobble frame with categorical Track/Artist/Album and an int64 uts"""
+
+    frame = pd.DataFrame({column: pd.Categorical(columns[column]) for column in CATEGORICAL_COLUMNS})
+    frame["uts"] = np.asarray(columns["uts"], dtype=np.int64)
+
+    return frame
+
+def listened_at(uts, tz):
+    """Epoch seconds to tz-aware timestamps - no string parsing involved"""
+
+    return pd.to_datetime(pd.Series(uts), unit="s", utc=True).dt.tz_convert(tz)
+
+def top_tracks_to_frame(tracks):
+    """Columnar replacement for building one process_track dict per user.getTopTracks entry"""
+
+    return pd.DataFrame({"Rank": np.fromiter((track["@attr"]["rank"] for track in tracks), dtype=np.int64, count=len(tracks)),
+                         "track_image": [track["image"][1]["#text"] for track in tracks],
+                         "mbid": [track["mbid"] for track in tracks],
+                         "Track": [track["name"] for track in tracks],
+                         "Artist": pd.Categorical([track["artist"]["name"] for track in tracks]),
+                         "Streams": np.fromiter((track["playcount"] for track in tracks), dtype=np.int64, count=len(tracks)),
+                         # seconds, 0 where last.fm doesn't know the length
+                         "Duration": np.fromiter((track.get("duration") or 0 for track in tracks), dtype=np.int64, count=len(tracks))},
+                        columns=TOP_TRACK_COLUMNS)
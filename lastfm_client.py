@@ -0,0 +1,121 @@
+import os
+import random
+import time
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+import metrics
+from rate_limit import LASTFM_LIMITER
+
+### ENV. VARIABLES ###
+load_dotenv()
+
+USER_AGENT = os.getenv('LASTFM_USER_AGENT')
+API_KEY = os.getenv('LASTFM_API_KEY')
+
+### CONSTANTS ###
+API_URL = 'https://ws.audioscrobbler.com/2.0/'
+
+# (connect, read) seconds
+TIMEOUT = (5, 20)
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30
+POOL_SIZE = 16
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# https://www.last.fm/api/errorcodes - 8: operation failed, 11: service offline,
+# 16: temporarily unavailable, 29: rate limit exceeded
+RETRY_ERROR_CODES = {8, 11, 16, 29}
+
+### CLASSES ###
+class LastfmClient:
+    """One pooled keep-alive session for every last.fm call in the process
+
+    Transient failures (connection errors, timeouts, 429/5xx and last.fm's own
+    "try again" error codes) are retried with jittered exponential backoff,
+    honouring Retry-After when the server sends one. Callers take a LASTFM_LIMITER
+    token for the first attempt; each retry takes its own. Latency, payload bytes,
+    retries and errors are recorded per API method in `metrics`.
+    """
+
+    def __init__(self, api_key=API_KEY, user_agent=USER_AGENT):
+        self.api_key = api_key
+        self.session = requests.Session()
+        self.session.headers.update({'user-agent': user_agent})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount('https://', adapter)
+
+    def get(self, payload):
+        """GETs an API method, retrying transient failures; returns the final response"""
+
+        params = {**payload, 'api_key': self.api_key, 'format': 'json'}
+        method = payload.get('method', '')
+        start = time.perf_counter()
+        attempt = 0
+
+        while True:
+            delay, response = None, None
+
+            try:
+                response = self.session.get(API_URL, params=params, timeout=TIMEOUT)
+                delay = self._retry_delay(response, attempt)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= MAX_RETRIES:
+                    self._record(method, start, attempt, None)
+                    raise
+                delay = self._backoff(attempt)
+
+            if delay is None or attempt >= MAX_RETRIES:
+                self._record(method, start, attempt, response)
+                return response
+
+            time.sleep(delay)
+            attempt += 1
+            LASTFM_LIMITER.acquire()
+
+    def _retry_delay(self, response, attempt):
+        """Seconds to wait before retrying `response`, or None if it is final"""
+
+        if response.status_code in RETRY_STATUSES:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return min(int(retry_after), BACKOFF_CAP)
+            return self._backoff(attempt)
+
+        if response.ok:
+            try:
+                error = response.json().get('error')
+            except ValueError:
+                return self._backoff(attempt)
+            if error in RETRY_ERROR_CODES:
+                return self._backoff(attempt)
+
+        return None
+
+    @staticmethod
+    def _backoff(attempt):
+        """Full-jitter exponential backoff"""
+
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+    @staticmethod
+    def _record(method, start, retries, response):
+        metrics.observe("lastfm_api_seconds", time.perf_counter() - start, method=method)
+        metrics.inc("lastfm_api_calls_total", method=method)
+        metrics.inc("lastfm_api_retries_total", retries, method=method)
+
+        if response is None or not response.ok:
+            metrics.inc("lastfm_api_errors_total", method=method)
+        if response is not None:
+            metrics.inc("lastfm_api_bytes_total", len(response.content), method=method)
+
+CLIENT = LastfmClient()
+
+### FUNCTIONS ###
+def lastfm_get(payload):
+    """Function to streamline API calls"""
+
+    return CLIENT.get(payload)
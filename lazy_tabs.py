@@ -0,0 +1,92 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+import metrics
+
+### CONSTANTS ###
+MAX_WORKERS = 4
+POLL_SECONDS = 1
+MAX_FUTURES = 256
+# a failed background run is only retried this long after it failed
+RETRY_SECONDS = 60
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="lazy-pane")
+_FUTURES = {}
+_LOCK = threading.Lock()
+
+### FUNCTIONS ###
+def render(panes, key):
+    """Drop-in for st.tabs that only runs the selected pane
+
+    `panes` maps each label to a zero-argument function that draws it. st.tabs runs
+    every tab's code on every rerun; here a pane's code (and its data fetching) only
+    runs while that pane is open, so a page load costs one pane, not all of them.
+    """
+
+    labels = list(panes)
+    selected = st.radio("Section", labels, horizontal=True, key=key, label_visibility="collapsed")
+
+    with metrics.timer("render_seconds", tab=selected):
+        panes[selected]()
+
+    return selected
+
+def prefetch(fn, *args):
+    """Starts `fn(*args)` in the background (e.g. warming the data layer for another pane)"""
+
+    return _EXECUTOR.submit(fn, *args)
+
+def _submit(fn, *args):
+    future = _EXECUTOR.submit(fn, *args)
+    future.add_done_callback(lambda done: setattr(done, "finished_at", time.time()))
+
+    return future
+
+def deferred(key, fn, *args):
+    """Result of `fn(*args)` if a background run for `key` has finished, else None
+
+    The first call starts the run; later calls with the same key pick up its result.
+    If the run failed, its exception is raised here, and a new run is only started
+    once RETRY_SECONDS have passed - callers polling every second don't resend the
+    whole batch of requests each time.
+    """
+
+    with _LOCK:
+        future = _FUTURES.get(key)
+        if future is None or (future.done() and future.exception() is not None
+                              and time.time() - getattr(future, "finished_at", 0) >= RETRY_SECONDS):
+            future = _FUTURES[key] = _submit(fn, *args)
+
+        if len(_FUTURES) > MAX_FUTURES:
+            for stale in [k for k, f in _FUTURES.items() if f.done() and k != key]:
+                del _FUTURES[stale]
+
+    return future.result() if future.done() else None
+
+def when_ready(key, fn, args, draw, placeholder="Loading..."):
+    """Draws `draw(fn(*args))` once the background run is done, showing `placeholder` until then
+
+    Runs as a fragment, so waiting re-runs only this block rather than the whole page,
+    and it stops polling as soon as the result is in - or the run has failed, in which
+    case the error is shown instead.
+    """
+
+    @st.fragment
+    def fragment():
+        try:
+            result = deferred(key, fn, *args)
+        except Exception as e:
+            st.error(f"Couldn't load this section: {e}")
+            return
+
+        if result is None:
+            st.caption(placeholder)
+            time.sleep(POLL_SECONDS)
+            st.rerun(scope="fragment")
+
+        draw(result)
+
+    fragment()
@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+### ENV. VARIABLES ###
+METRICS_PORT = os.getenv("METRICS_PORT")
+# the sync worker is a separate process, so it needs a port of its own
+WORKER_METRICS_PORT = os.getenv("WORKER_METRICS_PORT")
+
+### CONSTANTS ###
+# recent observations kept per series for the percentiles
+RESERVOIR_SIZE = 2048
+QUANTILES = [0.5, 0.9, 0.99]
+
+### CLASSES ###
+class Registry:
+    """In-process counters and latency summaries, labelled Prometheus-style"""
+
+    def __init__(self):
+        self._counters = defaultdict(float)
+        self._samples = defaultdict(lambda: deque(maxlen=RESERVOIR_SIZE))
+        self._totals = defaultdict(lambda: [0, 0.0])
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._samples[key].append(value)
+            self._totals[key][0] += 1
+            self._totals[key][1] += value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observes the wall-clock seconds spent inside the block"""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """Every series as a dict: counters carry `value`, summaries count/sum/max and quantiles"""
+
+        with self._lock:
+            counters = dict(self._counters)
+            summaries = {key: (sorted(samples), *self._totals[key]) for key, samples in self._samples.items()}
+
+        rows = [{"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(counters.items())]
+
+        for (name, labels), (samples, count, total) in sorted(summaries.items()):
+            row = {"name": name, "labels": dict(labels), "count": count, "sum": total, "max": samples[-1]}
+            for q in QUANTILES:
+                row[f"p{round(q * 100)}"] = samples[min(len(samples) - 1, int(q * len(samples)))]
+            rows.append(row)
+
+        return rows
+
+    def to_json(self):
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self):
+        """Prometheus text exposition format (counters and summaries)"""
+
+        lines = []
+        typed = set()
+        for row in self.snapshot():
+            labels = row["labels"]
+            if row["name"] not in typed:
+                typed.add(row["name"])
+                lines.append(f"# TYPE {row['name']} {'counter' if 'value' in row else 'summary'}")
+
+            if "value" in row:
+                lines.append(f"{row['name']}{_labels(labels)} {row['value']}")
+                continue
+
+            for q in QUANTILES:
+                lines.append(f"{row['name']}{_labels({**labels, 'quantile': q})} {row[f'p{round(q * 100)}']}")
+            lines.append(f"{row['name']}_count{_labels(labels)} {row['count']}")
+            lines.append(f"{row['name']}_sum{_labels(labels)} {row['sum']}")
+
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+
+### FUNCTIONS ###
+def _labels(labels):
+    if not labels:
+        return ""
+
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in labels.values())
+
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = REGISTRY.to_prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = REGISTRY.to_json(), "application/json"
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+_SERVER_LOCK = threading.Lock()
+_SERVER = None
+_UNAVAILABLE = set()
+
+def serve(port=METRICS_PORT):
+    """Serves /metrics (Prometheus text) and /metrics.json on `port`, once per process
+
+    If the port is taken (e.g. by another process sharing METRICS_PORT) this says so
+    once and carries on without an endpoint, rather than failing the caller.
+    """
+
+    global _SERVER
+
+    with _SERVER_LOCK:
+        if _SERVER is None and port and port not in _UNAVAILABLE:
+            try:
+                _SERVER = ThreadingHTTPServer(("0.0.0.0", int(port)), _Handler)
+            except OSError as e:
+                _UNAVAILABLE.add(port)
+                print(f"Metrics not served: can't bind port {port} ({e})")
+                return None
+            threading.Thread(target=_SERVER.serve_forever, name="metrics", daemon=True).start()
+
+    return _SERVER
+
+def render_debug_panel():
+    """Collapsible per-series latency table for the dashboards"""
+
+    import pandas as pd
+    import streamlit as st
+
+    with st.expander("Performance", expanded=False):
+        rows = REGISTRY.snapshot()
+        summaries = [row for row in rows if "count" in row]
+        counters = [row for row in rows if "value" in row]
+
+        if summaries:
+            st.dataframe(pd.DataFrame([{"series": row["name"] + _labels(row["labels"]),
+                                        "count": row["count"],
+                                        "p50 (ms)": row["p50"] * 1000,
+                                        "p99 (ms)": row["p99"] * 1000,
+                                        "max (ms)": row["max"] * 1000}
+                                       for row in summaries]),
+                         use_container_width=True)
+        if counters:
+            st.dataframe(pd.DataFrame([{"series": row["name"] + _labels(row["labels"]), "value": row["value"]}
+                                       for row in counters]),
+                         use_container_width=True)
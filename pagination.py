@@ -0,0 +1,47 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rate_limit import LASTFM_LIMITER
+
+### CONSTANTS ###
+PAGE_SIZE = 200
+MAX_WORKERS = 4
+
+### FUNCTIONS ###
+def fetch_recent_tracks(lastfm_get, user, since, limiter=LASTFM_LIMITER, max_workers=MAX_WORKERS, max_pages=None):
+    """Fetches user.getRecentTracks pages since `since` concurrently, oldest page first
+
+    The first page doubles as the probe: its `@attr` carries the page count, so the
+    remaining pages can be requested at once. The `to` bound is pinned to the first
+    request so page boundaries don't shift if a new scrobble lands mid-fetch.
+
+    With `max_pages`, only the oldest `max_pages` pages are returned. Because they are
+    the oldest, storing them advances the high-water mark without leaving a gap, and
+    the next call carries on from there. Returns (pages, complete).
+    """
+
+    params = {'method': 'user.getRecentTracks',
+              'user': user,
+              'from': int(since),
+              'to': int(time.time()),
+              'limit': str(PAGE_SIZE)}
+
+    def fetch_page(page):
+        limiter.acquire()
+        response = lastfm_get({**params, 'page': page})
+
+        return response.json()["recenttracks"]
+
+    first = fetch_page(1)
+    total_pages = int(first["@attr"]["totalPages"])
+    count = total_pages if max_pages is None else min(total_pages, max_pages)
+    newest = max(1, total_pages - count + 1)
+
+    # executor.map yields results in submission order, so pages stay oldest first
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pages = list(executor.map(fetch_page, range(total_pages, max(newest, 2) - 1, -1)))
+
+    if newest == 1:
+        pages.append(first)
+
+    return [page["track"] for page in pages], newest == 1
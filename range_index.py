@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+
+import scrobble_store
+
+### ENV. VARIABLES ###
+INDEX_DIR = os.getenv("RANGE_INDEX_DIR", "range_index")
+
+### CONSTANTS ###
+TIMEZONE = scrobble_store.TIMEZONE
+
+# units per second of each indexed table's time column (uts is seconds, played_at ms)
+TIME_UNITS = {"scrobbles": 1, "spotify_plays": 1000}
+
+### CLASSES ###
+class RangeIndex:
+    """Sorted play timestamps of one (table, user), memory-mapped, alongside their store rowids
+
+    `times` is an ascending int64 array and `rowids[i]` the store row `times[i]` came
+    from, so any time range is two binary searches away from a slice of rowids - no
+    scan, and paging within the range costs the same at any offset. Rows stored later
+    are appended to the files in place; a batch that lands before the end (a backfill
+    of older history) rewrites them under a new generation, so readers that already
+    mapped the old files are unaffected.
+    """
+
+    def __init__(self, table, user, directory=INDEX_DIR):
+        self.table = table
+        self.user = user
+        self.time_column = scrobble_store.PAGED_TABLES[table][0]
+        self.units = TIME_UNITS[table]
+        self._base = os.path.join(directory, f"{table}-{hashlib.sha1(user.encode()).hexdigest()[:16]}")
+        self._lock = threading.Lock()
+        self._meta = None
+        self.times = np.empty(0, np.int64)
+        self.rowids = np.empty(0, np.int64)
+
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    def _path(self, generation, name):
+        return f"{self._base}.{generation}.{name}"
+
+    def _read_meta(self):
+        try:
+            with open(f"{self._base}.json") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"generation": 0, "rowid": 0, "count": 0}
+
+    def _write_meta(self, meta):
+        tmp = f"{self._base}.json.tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, f"{self._base}.json")
+
+    def load(self):
+        """Maps the files as of the latest metadata (another process may have advanced them)"""
+
+        while True:
+            meta = self._read_meta()
+            if meta == self._meta:
+                return
+
+            try:
+                if meta["count"]:
+                    self.times = np.memmap(self._path(meta["generation"], "times"), dtype=np.int64,
+                                           mode="r", shape=(meta["count"],))
+                    self.rowids = np.memmap(self._path(meta["generation"], "rowids"), dtype=np.int64,
+                                            mode="r", shape=(meta["count"],))
+                else:
+                    self.times = self.rowids = np.empty(0, np.int64)
+            except FileNotFoundError:
+                # rewritten under a newer generation between reading the metadata and mapping
+                continue
+
+            self._meta = meta
+            return
+
+    def refresh(self, conn):
+        """Indexes rows stored since the last refresh; returns how many were added"""
+
+        with self._lock:
+            self.load()
+            meta = dict(self._meta)
+
+            max_rowid = conn.execute(f"SELECT MAX(rowid) FROM {self.table}").fetchone()[0] or 0
+            if max_rowid == meta["rowid"]:
+                return 0
+
+            stale_generation = None
+
+            # the store was recreated underneath the index: start over
+            if max_rowid < meta["rowid"]:
+                stale_generation = meta["generation"] if meta["count"] else None
+                meta = {"generation": meta["generation"] + 1, "rowid": 0, "count": 0}
+
+            # `+user` keeps SQLite on the rowid range instead of the (user, time) index
+            rows = conn.execute(f"SELECT {self.time_column}, rowid FROM {self.table} "
+                                f"WHERE rowid > ? AND rowid <= ? AND +user = ? ORDER BY {self.time_column}",
+                                (meta["rowid"], max_rowid, self.user)).fetchall()
+            meta["rowid"] = max_rowid
+
+            if rows:
+                times, rowids = (np.array(column, dtype=np.int64) for column in zip(*rows))
+
+                if not meta["count"] or times[0] >= self.times[-1]:
+                    _write_at(self._path(meta["generation"], "times"), meta["count"], times)
+                    _write_at(self._path(meta["generation"], "rowids"), meta["count"], rowids)
+                else:
+                    times = np.concatenate([self.times, times])
+                    rowids = np.concatenate([self.rowids, rowids])
+                    order = np.argsort(times, kind="stable")
+
+                    stale_generation = meta["generation"]
+                    meta["generation"] += 1
+                    times[order].tofile(self._path(meta["generation"], "times"))
+                    rowids[order].tofile(self._path(meta["generation"], "rowids"))
+
+                meta["count"] += len(rows)
+
+            self._write_meta(meta)
+
+            if stale_generation is not None:
+                for name in ("times", "rowids"):
+                    os.remove(self._path(stale_generation, name))
+
+            self.load()
+
+            return len(rows)
+
+    def to_units(self, moment):
+        """A tz-aware datetime as this table's epoch units (None stays None)"""
+
+        if moment is None:
+            return None
+        if moment.tzinfo is None:
+            raise ValueError("range bounds must be tz-aware")
+
+        return int(moment.timestamp() * self.units)
+
+    def positions(self, start=None, end=None):
+        """[lo, hi) positions in `times` of plays with start <= played < end"""
+
+        lo = 0 if start is None else int(np.searchsorted(self.times, self.to_units(start), "left"))
+        hi = len(self.times) if end is None else int(np.searchsorted(self.times, self.to_units(end), "left"))
+
+        return lo, max(lo, hi)
+
+    def count(self, start=None, end=None):
+        lo, hi = self.positions(start, end)
+
+        return hi - lo
+
+    def rowids_between(self, start=None, end=None, offset=0, limit=None, descending=True):
+        """Store rowids of one page of plays in [start, end), newest first unless `descending` is False"""
+
+        lo, hi = self.positions(start, end)
+
+        if descending:
+            stop = hi - offset
+            rowids = self.rowids[max(lo, stop - limit) if limit is not None else lo:max(lo, stop)][::-1]
+        else:
+            first = lo + offset
+            rowids = self.rowids[first:min(hi, first + limit) if limit is not None else hi]
+
+        return np.asarray(rowids)
+
+    def daily_counts(self, start, end):
+        """Plays per TIMEZONE day over [start, end), counted from the index alone"""
+
+        days = pd.date_range(start.astimezone(TIMEZONE).date(), end.astimezone(TIMEZONE).date(), freq="D")
+        bounds = [max(start, TIMEZONE.localize(datetime.combine(day.date(), time()))) for day in days]
+        bounds = [bound for bound in bounds if bound < end] + [end]
+        edges = np.searchsorted(self.times, [self.to_units(bound) for bound in bounds], "left")
+
+        return pd.Series(np.diff(edges), index=[bound.date() for bound in bounds[:-1]], name="plays")
+
+### FUNCTIONS ###
+def _write_at(path, count, values):
+    """Writes `values` after the first `count` entries of an int64 file, dropping anything past them
+
+    Whatever lies beyond `count` was never published in the metadata (an interrupted
+    refresh), so it's overwritten rather than appended to.
+    """
+
+    with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+        f.seek(count * values.itemsize)
+        f.write(values.tobytes())
+        f.truncate()
+
+def date_range_bounds(start_date, end_date, tz=TIMEZONE):
+    """[start, end) datetimes covering the calendar days start_date..end_date in `tz`"""
+
+    start = tz.localize(datetime.combine(start_date, time()))
+    end = tz.localize(datetime.combine(end_date + timedelta(days=1), time()))
+
+    return start, end
@@ -0,0 +1,38 @@
+import threading
+import time
+
+### CONSTANTS ###
+# last.fm asks for no more than 5 requests per second, averaged over 5 minutes
+LASTFM_RATE = 5
+LASTFM_BURST = 5
+
+### CLASSES ###
+class RateLimiter:
+    """Thread-safe token bucket: `rate` requests per second, bursting up to `burst`"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request may be made"""
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+# shared by every last.fm caller in the process
+LASTFM_LIMITER = RateLimiter(LASTFM_RATE, LASTFM_BURST)
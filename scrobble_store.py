@@ -0,0 +1,572 @@
+import functools
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytz
+
+import hyperloglog
+import ingest
+import pagination
+
+### ENV. VARIABLES ###
+STORE_PATH = os.getenv("SCROBBLE_STORE_PATH", "scrobbles.db")
+
+TIMEZONE = pytz.timezone("US/Central")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scrobbles (
+    user TEXT NOT NULL,
+    uts INTEGER NOT NULL,
+    track TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    album TEXT NOT NULL,
+    UNIQUE (user, uts, artist, track)
+);
+CREATE INDEX IF NOT EXISTS idx_scrobbles_user_uts ON scrobbles (user, uts);
+
+-- per-day play counts in TIMEZONE, maintained from newly inserted scrobbles only
+CREATE TABLE IF NOT EXISTS daily_track_plays (
+    user TEXT NOT NULL,
+    day TEXT NOT NULL,
+    track TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    album TEXT NOT NULL,
+    plays INTEGER NOT NULL,
+    PRIMARY KEY (user, day, track, artist, album)
+);
+CREATE TABLE IF NOT EXISTS daily_artist_plays (
+    user TEXT NOT NULL,
+    day TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    plays INTEGER NOT NULL,
+    PRIMARY KEY (user, day, artist)
+);
+
+-- per-hour (epoch hour, uts / 3600) play counts, for trend charts finer than a day
+CREATE TABLE IF NOT EXISTS hourly_artist_plays (
+    user TEXT NOT NULL,
+    hour INTEGER NOT NULL,
+    artist TEXT NOT NULL,
+    plays INTEGER NOT NULL,
+    PRIMARY KEY (user, hour, artist)
+);
+
+-- per-day listening stats in TIMEZONE, recomputed only for the days a batch touches
+CREATE TABLE IF NOT EXISTS daily_stats (
+    user TEXT NOT NULL,
+    day TEXT NOT NULL,
+    scrobbles INTEGER NOT NULL,
+    unique_tracks INTEGER NOT NULL,
+    unique_artists INTEGER NOT NULL,
+    seconds INTEGER NOT NULL,
+    PRIMARY KEY (user, day)
+);
+-- HyperLogLog registers for all-time distinct tracks/artists
+CREATE TABLE IF NOT EXISTS distinct_sketches (
+    user TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    registers BLOB NOT NULL,
+    PRIMARY KEY (user, kind)
+);
+
+-- spotify's recently-played, accumulated past the API's 50-item window
+CREATE TABLE IF NOT EXISTS spotify_plays (
+    user TEXT NOT NULL,
+    played_at INTEGER NOT NULL,
+    track TEXT NOT NULL,
+    artists TEXT NOT NULL,
+    album TEXT NOT NULL,
+    uri TEXT NOT NULL,
+    PRIMARY KEY (user, played_at)
+);
+
+-- bookkeeping shared by the sync worker and the dashboards
+CREATE TABLE IF NOT EXISTS sync_state (
+    user TEXT NOT NULL,
+    job TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (user, job)
+);
+CREATE TABLE IF NOT EXISTS active_users (
+    user TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS top_tracks (
+    user TEXT NOT NULL,
+    period TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (user, period)
+);
+
+-- staging area for a batch of scrobbles, private to the connection
+CREATE TEMP TABLE IF NOT EXISTS incoming (
+    user TEXT NOT NULL,
+    uts INTEGER NOT NULL,
+    track TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    album TEXT NOT NULL,
+    day TEXT NOT NULL,
+    UNIQUE (user, uts, artist, track)
+);
+"""
+
+ROLL_UP = """
+INSERT INTO daily_track_plays (user, day, track, artist, album, plays)
+SELECT user, day, track, artist, album, COUNT(*) FROM temp.incoming
+GROUP BY user, day, track, artist, album
+ON CONFLICT (user, day, track, artist, album) DO UPDATE SET plays = plays + excluded.plays;
+
+INSERT INTO daily_artist_plays (user, day, artist, plays)
+SELECT user, day, artist, COUNT(*) FROM temp.incoming
+GROUP BY user, day, artist
+ON CONFLICT (user, day, artist) DO UPDATE SET plays = plays + excluded.plays;
+
+INSERT INTO hourly_artist_plays (user, hour, artist, plays)
+SELECT user, uts / 3600, artist, COUNT(*) FROM temp.incoming
+GROUP BY user, uts / 3600, artist
+ON CONFLICT (user, hour, artist) DO UPDATE SET plays = plays + excluded.plays;
+"""
+
+# listening time is estimated from each scrobble's gap to the next one; a longer gap
+# (or no next scrobble yet) means the listener stopped, and a typical track length is counted
+MAX_GAP = 10 * 60
+DEFAULT_TRACK_SECONDS = 210
+
+LISTENING_SECONDS = """
+SELECT COALESCE(SUM(CASE WHEN next_uts - uts <= ? THEN next_uts - uts ELSE ? END), 0) FROM (
+    SELECT uts, LEAD(uts) OVER (ORDER BY uts) AS next_uts FROM scrobbles
+    WHERE user = ? AND uts >= ? AND uts < ?
+) WHERE uts < ?
+"""
+
+# tables served a page at a time: their time column and {frame column: SQL column};
+# only these names ever reach an ORDER BY, so sort keys can't inject SQL
+PAGED_TABLES = {"scrobbles": ("uts", {"Track": "track",
+                                      "Artist": "artist",
+                                      "Album": "album",
+                                      "uts": "uts"}),
+                "spotify_plays": ("played_at", {"played_at": "played_at",
+                                                "name": "track",
+                                                "artists": "artists",
+                                                "album": "album"})}
+
+_LOCK = threading.Lock()
+
+### FUNCTIONS ###
+def connect(path=STORE_PATH):
+    """Opens the scrobble store, creating the schema on first use"""
+
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+
+    # stores created before the rollups existed get them built once
+    has_scrobbles = conn.execute("SELECT 1 FROM scrobbles LIMIT 1").fetchone()
+    has_rollups = all(conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+                      for table in ("daily_track_plays", "hourly_artist_plays", "daily_stats"))
+    if has_scrobbles and not has_rollups:
+        rebuild_rollups(conn)
+
+    return conn
+
+@functools.lru_cache(maxsize=100_000)
+def _day_of_quarter_hour(quarter_hour):
+    # every UTC offset is a multiple of 15 minutes, so the local day is constant within one
+    return datetime.fromtimestamp(quarter_hour * 900, TIMEZONE).strftime("%Y-%m-%d")
+
+def week_start(now=None):
+    """Monday 00:00 in TIMEZONE of the current (or `now`'s) week"""
+
+    now = now or datetime.now(TIMEZONE)
+
+    return (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def local_day(uts):
+    """The TIMEZONE calendar day (YYYY-MM-DD) a scrobble falls on"""
+
+    return _day_of_quarter_hour(int(uts) // 900)
+
+def high_water_mark(conn, user):
+    """Timestamp of the newest stored scrobble for a user (None if empty)"""
+
+    row = conn.execute("SELECT MAX(uts) FROM scrobbles WHERE user = ?", (user,)).fetchone()
+
+    return row[0]
+
+def low_water_mark(conn, user):
+    """Timestamp of the oldest stored scrobble for a user (None if empty)"""
+
+    row = conn.execute("SELECT MIN(uts) FROM scrobbles WHERE user = ?", (user,)).fetchone()
+
+    return row[0]
+
+def scrobble_count(conn, user):
+    """How many scrobbles are stored for a user; changes with every insert, backfills included"""
+
+    return conn.execute("SELECT COUNT(*) FROM scrobbles WHERE user = ?", (user,)).fetchone()[0]
+
+def insert_scrobbles(conn, user, columns):
+    """Inserts a page of scrobble columns (see ingest.recent_tracks_to_columns), skipping duplicates
+
+    Only scrobbles that weren't already stored are rolled up into the daily tables,
+    in the same transaction as the insert.
+    """
+
+    uts = columns["uts"].tolist()
+    rows = zip(itertools.repeat(user),
+               uts,
+               columns["Track"],
+               columns["Artist"],
+               columns["Album"],
+               map(local_day, uts))
+
+    with _LOCK, conn:
+        conn.execute("DELETE FROM temp.incoming")
+        conn.executemany("INSERT OR IGNORE INTO temp.incoming (user, uts, track, artist, album, day) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("DELETE FROM temp.incoming WHERE EXISTS ("
+                     "SELECT 1 FROM scrobbles AS s WHERE s.user = incoming.user AND s.uts = incoming.uts "
+                     "AND s.artist = incoming.artist AND s.track = incoming.track)")
+        conn.execute("INSERT INTO scrobbles (user, uts, track, artist, album) "
+                     "SELECT user, uts, track, artist, album FROM temp.incoming")
+        _roll_up(conn)
+
+        inserted = conn.execute("SELECT COUNT(*) FROM temp.incoming").fetchone()[0]
+        if inserted:
+            _add_to_sketches(conn, user, conn.execute("SELECT track, artist FROM temp.incoming"))
+            _update_daily_stats(conn, user, _touched_days(conn, user))
+
+        return inserted
+
+def _roll_up(conn):
+    for statement in ROLL_UP.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+
+def _day_bounds(day):
+    """[start, end) epoch seconds of a TIMEZONE calendar day"""
+
+    start = TIMEZONE.localize(datetime.strptime(day, "%Y-%m-%d"))
+    end = TIMEZONE.localize(datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1))
+
+    return int(start.timestamp()), int(end.timestamp())
+
+def _touched_days(conn, user):
+    """Days whose stats the staged batch changes
+
+    Besides the batch's own days, the scrobble just before each day's earliest new
+    one gains a new "next scrobble", which changes its day's listening time.
+    """
+
+    days = set()
+
+    for day, first_uts in conn.execute("SELECT day, MIN(uts) FROM temp.incoming GROUP BY day").fetchall():
+        days.add(day)
+        previous = conn.execute("SELECT MAX(uts) FROM scrobbles WHERE user = ? AND uts < ?",
+                                (user, first_uts)).fetchone()[0]
+        if previous is not None:
+            days.add(local_day(previous))
+
+    return days
+
+def _update_daily_stats(conn, user, days):
+    """Recomputes daily_stats for `days` from the rollups and that day's scrobbles"""
+
+    rows = []
+
+    for day in days:
+        start, end = _day_bounds(day)
+        scrobbles, artists = conn.execute("SELECT COALESCE(SUM(plays), 0), COUNT(*) FROM daily_artist_plays "
+                                          "WHERE user = ? AND day = ?", (user, day)).fetchone()
+        tracks = conn.execute("SELECT COUNT(*) FROM (SELECT 1 FROM daily_track_plays "
+                              "WHERE user = ? AND day = ? GROUP BY track, artist)", (user, day)).fetchone()[0]
+        seconds = conn.execute(LISTENING_SECONDS, (MAX_GAP, DEFAULT_TRACK_SECONDS,
+                                                   user, start, end + MAX_GAP, end)).fetchone()[0]
+        rows.append((user, day, scrobbles, tracks, artists, seconds))
+
+    conn.executemany("INSERT OR REPLACE INTO daily_stats "
+                     "(user, day, scrobbles, unique_tracks, unique_artists, seconds) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+def _add_to_sketches(conn, user, rows):
+    """Feeds (track, artist) rows into the user's all-time distinct-count sketches"""
+
+    rows = list(rows)
+    sketches = {kind: hyperloglog.HyperLogLog(registers) for kind, registers
+                in conn.execute("SELECT kind, registers FROM distinct_sketches WHERE user = ?", (user,))}
+    tracks = sketches.setdefault("tracks", hyperloglog.HyperLogLog())
+    artists = sketches.setdefault("artists", hyperloglog.HyperLogLog())
+
+    tracks.add_many(f"{track}\x1f{artist}" for track, artist in rows)
+    artists.add_many(artist for _, artist in rows)
+
+    conn.executemany("INSERT OR REPLACE INTO distinct_sketches (user, kind, registers) VALUES (?, ?, ?)",
+                     [(user, kind, sketch.to_bytes()) for kind, sketch in sketches.items()])
+
+def rebuild_rollups(conn, user=None):
+    """Recomputes the daily tables from raw scrobbles (e.g. after a TIMEZONE change)"""
+
+    users = [user] if user else [row[0] for row in conn.execute("SELECT DISTINCT user FROM scrobbles")]
+
+    with _LOCK, conn:
+        for user in users:
+            conn.execute("DELETE FROM daily_track_plays WHERE user = ?", (user,))
+            conn.execute("DELETE FROM daily_artist_plays WHERE user = ?", (user,))
+            conn.execute("DELETE FROM hourly_artist_plays WHERE user = ?", (user,))
+            conn.execute("DELETE FROM daily_stats WHERE user = ?", (user,))
+            conn.execute("DELETE FROM distinct_sketches WHERE user = ?", (user,))
+
+            cursor = conn.execute("SELECT user, uts, track, artist, album FROM scrobbles WHERE user = ?", (user,))
+            while rows := cursor.fetchmany(50_000):
+                conn.execute("DELETE FROM temp.incoming")
+                conn.executemany("INSERT INTO temp.incoming (user, uts, track, artist, album, day) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)",
+                                 [(*row, local_day(row[1])) for row in rows])
+                _roll_up(conn)
+                _add_to_sketches(conn, user, [(row[2], row[3]) for row in rows])
+
+            days = [row[0] for row in conn.execute("SELECT DISTINCT day FROM daily_artist_plays WHERE user = ?", (user,))]
+            _update_daily_stats(conn, user, days)
+
+def sync_recent_tracks(conn, lastfm_get, user, since, max_pages=None):
+    """Pulls only scrobbles newer than the store's high-water mark (or `since` when empty)
+
+    Pages are stored oldest first, so an interrupted or `max_pages`-capped sync never
+    leaves a gap behind the high-water mark. Returns (inserted, complete).
+    """
+
+    hwm = high_water_mark(conn, user)
+    start = int(since) if hwm is None else max(int(since), hwm + 1)
+
+    pages, complete = pagination.fetch_recent_tracks(lastfm_get, user, start, max_pages=max_pages)
+    inserted = sum(insert_scrobbles(conn, user, ingest.recent_tracks_to_columns(page)) for page in pages)
+
+    if complete:
+        record_sync(conn, user, "recent_tracks")
+
+    return inserted, complete
+
+def get_tracks_since(conn, user, since):
+    """Reads stored scrobbles since `since`, newest first, as a categorical scrobble frame"""
+
+    cursor = conn.execute("SELECT track, artist, album, uts FROM scrobbles "
+                          "WHERE user = ? AND uts >= ? ORDER BY uts DESC",
+                          (user, int(since)))
+    frame = ingest.ScrobbleColumns()
+
+    while rows := cursor.fetchmany(10_000):
+        tracks, artists, albums, uts = zip(*rows)
+        frame.append({"Track": tracks,
+                      "Artist": artists,
+                      "Album": albums,
+                      "uts": np.fromiter(uts, dtype=np.int64, count=len(uts))})
+
+    return frame.to_frame()
+
+def top_tracks_between(conn, user, start_day, end_day=None):
+    """Ranked plays per (track, artist, album) over TIMEZONE days [start_day, end_day]"""
+
+    rows = conn.execute("SELECT track, artist, album, SUM(plays) AS streams FROM daily_track_plays "
+                        "WHERE user = ? AND day >= ? AND day <= ? "
+                        "GROUP BY track, artist, album ORDER BY streams DESC, track",
+                        (user, str(start_day), str(end_day or "9999-12-31"))).fetchall()
+
+    frame = pd.DataFrame(rows, columns=["Track", "Artist", "Album", "Streams"])
+    frame.insert(0, "Rank", range(1, frame.shape[0] + 1))
+
+    return frame
+
+def artist_plays_between(conn, user, start_day, end_day=None):
+    """Plays per artist over TIMEZONE days [start_day, end_day], most played first"""
+
+    rows = conn.execute("SELECT artist, SUM(plays) AS streams FROM daily_artist_plays "
+                        "WHERE user = ? AND day >= ? AND day <= ? "
+                        "GROUP BY artist ORDER BY streams DESC, artist",
+                        (user, str(start_day), str(end_day or "9999-12-31"))).fetchall()
+
+    return pd.DataFrame(rows, columns=["Artist", "count"])
+
+def play_bins(conn, user, bin, start, end, track=None, artist=None, artists=None):
+    """[(bin, plays)] over uts [start, end) for non-empty bins, oldest first
+
+    `bin` is "hour" (keys are epoch hours) or "day" (keys are TIMEZONE YYYY-MM-DD).
+    Counts cover every play, one `artist`, a set of `artists`, or one `track` (which
+    needs its `artist` too); all come from the rollups except hourly track counts,
+    which are read from the scrobbles in range.
+    """
+
+    where, params = "user = ?", [user]
+    if artists is not None:
+        artists = list(artists)
+        where += f" AND artist IN ({', '.join('?' * len(artists))})"
+        params += artists
+    elif artist is not None:
+        where += " AND artist = ?"
+        params.append(artist)
+    if track is not None:
+        where += " AND track = ?"
+        params.append(track)
+
+    if bin == "hour" and track is not None:
+        query = (f"SELECT uts / 3600 AS bin, COUNT(*) FROM scrobbles WHERE {where} "
+                 "AND uts >= ? AND uts < ? GROUP BY bin ORDER BY bin")
+        bounds = [int(start), int(end)]
+    elif bin == "hour":
+        query = (f"SELECT hour, SUM(plays) FROM hourly_artist_plays WHERE {where} "
+                 "AND hour >= ? AND hour < ? GROUP BY hour ORDER BY hour")
+        bounds = [int(start) // 3600, -(-int(end) // 3600)]
+    else:
+        table = "daily_track_plays" if track is not None else "daily_artist_plays"
+        query = (f"SELECT day, SUM(plays) FROM {table} WHERE {where} "
+                 "AND day >= ? AND day <= ? GROUP BY day ORDER BY day")
+        bounds = [local_day(start), local_day(end - 1)]
+
+    return conn.execute(query, params + bounds).fetchall()
+
+def daily_stats(conn, user, start_day, end_day=None):
+    """Per-day scrobbles, distinct tracks and artists, and estimated listening seconds over [start_day, end_day]"""
+
+    rows = conn.execute("SELECT day, scrobbles, unique_tracks, unique_artists, seconds FROM daily_stats "
+                        "WHERE user = ? AND day >= ? AND day <= ? ORDER BY day",
+                        (user, str(start_day), str(end_day or "9999-12-31"))).fetchall()
+
+    return pd.DataFrame(rows, columns=["day", "scrobbles", "unique_tracks", "unique_artists", "seconds"])
+
+def stats_between(conn, user, start_day, end_day=None, approximate=False):
+    """{scrobbles, unique_tracks, unique_artists, seconds} over TIMEZONE days [start_day, end_day]
+
+    Distinct counts over a range aren't sums of daily ones, so they come from the
+    rollups - or, with `approximate` and no bounds (all time), from the HyperLogLog
+    sketches in constant time.
+    """
+
+    params = (user, str(start_day or "0000-00-00"), str(end_day or "9999-12-31"))
+    scrobbles, seconds = conn.execute("SELECT COALESCE(SUM(scrobbles), 0), COALESCE(SUM(seconds), 0) FROM daily_stats "
+                                      "WHERE user = ? AND day >= ? AND day <= ?", params).fetchone()
+
+    if approximate and start_day is None and end_day is None:
+        sketches = dict(conn.execute("SELECT kind, registers FROM distinct_sketches WHERE user = ?", (user,)).fetchall())
+        tracks, artists = (hyperloglog.HyperLogLog(sketches[kind]).count() if kind in sketches else 0
+                           for kind in ("tracks", "artists"))
+    else:
+        tracks = conn.execute("SELECT COUNT(*) FROM (SELECT DISTINCT track, artist FROM daily_track_plays "
+                              "WHERE user = ? AND day >= ? AND day <= ?)", params).fetchone()[0]
+        artists = conn.execute("SELECT COUNT(DISTINCT artist) FROM daily_artist_plays "
+                               "WHERE user = ? AND day >= ? AND day <= ?", params).fetchone()[0]
+
+    return {"scrobbles": scrobbles, "unique_tracks": tracks, "unique_artists": artists, "seconds": seconds}
+
+def spotify_high_water_mark(conn, user):
+    """played_at (epoch ms) of the newest stored Spotify play for a user (None if empty)"""
+
+    row = conn.execute("SELECT MAX(played_at) FROM spotify_plays WHERE user = ?", (user,)).fetchone()
+
+    return row[0]
+
+def insert_spotify_plays(conn, user, items):
+    """Inserts current_user_recently_played items; plays already stored are ignored"""
+
+    rows = [(user,
+             int(datetime.fromisoformat(item["played_at"]).timestamp() * 1000),
+             item["track"]["name"],
+             ", ".join([art["name"] for art in item["track"]["artists"]]),
+             item["track"]["album"]["name"],
+             item["track"]["uri"])
+            for item in items]
+
+    with _LOCK, conn:
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO spotify_plays (user, played_at, track, artists, album, uri) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+        return conn.total_changes - before
+
+def read_page(conn, table, user, offset, limit, since=0, until=None, sort=None, descending=True, search=None):
+    """One page of a PAGED_TABLES table plus the number of rows matching the filter
+
+    Sorting, the `search` substring filter and LIMIT/OFFSET all run in SQLite, so
+    only `limit` rows are ever materialized however much history is stored.
+    """
+
+    time_column, columns = PAGED_TABLES[table]
+    text_columns = [column for column in columns.values() if column != time_column]
+
+    where = f"WHERE user = ? AND {time_column} >= ?"
+    params = [user, int(since)]
+    if until is not None:
+        where += f" AND {time_column} < ?"
+        params.append(int(until))
+    if search:
+        pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        where += " AND (" + " OR ".join(f"{column} LIKE ? ESCAPE '\\'" for column in text_columns) + ")"
+        params += [pattern] * len(text_columns)
+
+    order = "DESC" if descending else "ASC"
+    sort_column = columns.get(sort, time_column)
+
+    total = conn.execute(f"SELECT COUNT(*) FROM {table} {where}", params).fetchone()[0]
+    rows = conn.execute(f"SELECT {', '.join(columns.values())} FROM {table} {where} "
+                        f"ORDER BY {sort_column} {order}, {time_column} {order} LIMIT ? OFFSET ?",
+                        params + [int(limit), int(offset)]).fetchall()
+
+    return pd.DataFrame(rows, columns=list(columns)), total
+
+def read_rows(conn, table, rowids):
+    """Rows of a PAGED_TABLES table by rowid, in the order given (see range_index)"""
+
+    columns = PAGED_TABLES[table][1]
+    rowids = [int(rowid) for rowid in rowids]
+    by_rowid = {}
+
+    for i in range(0, len(rowids), 500):
+        chunk = rowids[i:i + 500]
+        marks = ", ".join("?" * len(chunk))
+        for rowid, *row in conn.execute(f"SELECT rowid, {', '.join(columns.values())} FROM {table} "
+                                        f"WHERE rowid IN ({marks})", chunk):
+            by_rowid[rowid] = row
+
+    return pd.DataFrame([by_rowid[rowid] for rowid in rowids if rowid in by_rowid], columns=list(columns))
+
+def record_sync(conn, user, job):
+    """Notes that `job` just finished for `user` (the worker's heartbeat uses user "*")"""
+
+    with _LOCK, conn:
+        conn.execute("INSERT OR REPLACE INTO sync_state (user, job, synced_at) VALUES (?, ?, ?)",
+                     (user, job, time.time()))
+
+def last_synced(conn, user, job):
+    """Epoch seconds of the last completed `job` for `user` (None if never)"""
+
+    row = conn.execute("SELECT synced_at FROM sync_state WHERE user = ? AND job = ?", (user, job)).fetchone()
+
+    return row[0] if row else None
+
+def mark_active(conn, user):
+    """Dashboard heartbeat, read by the sync worker to prioritize the user"""
+
+    with _LOCK, conn:
+        conn.execute("INSERT OR REPLACE INTO active_users (user, last_seen) VALUES (?, ?)", (user, time.time()))
+
+def active_users(conn, since):
+    """{user: last_seen} for users seen on a dashboard since `since`"""
+
+    return dict(conn.execute("SELECT user, last_seen FROM active_users WHERE last_seen >= ?", (since,)).fetchall())
+
+def save_top_tracks(conn, user, period, tracks):
+    with _LOCK, conn:
+        conn.execute("INSERT OR REPLACE INTO top_tracks (user, period, payload) VALUES (?, ?, ?)",
+                     (user, period, json.dumps(tracks)))
+
+def load_top_tracks(conn, user, period):
+    """The worker's last user.getTopTracks snapshot for a period (None if there isn't one)"""
+
+    row = conn.execute("SELECT payload FROM top_tracks WHERE user = ? AND period = ?", (user, period)).fetchone()
+
+    return json.loads(row[0]) if row else None
@@ -0,0 +1,136 @@
+"""Arrow IPC snapshots of a user's daily track and artist rollups
+
+The sync worker rewrites them periodically (see sync_worker.py); dashboards map
+them with pa.memory_map, so opening years of rollups costs no parsing or copying
+and every session - in every process - reads the same page-cache pages. Files are
+uncompressed on purpose: compressed buffers would have to be decoded into private
+memory.
+
+    <SNAPSHOT_DIR>/<sha1(user)[:16]>/{daily_track_plays,daily_artist_plays}.arrow
+"""
+import functools
+import hashlib
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import scrobble_store
+
+### ENV. VARIABLES ###
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+
+### CONSTANTS ###
+BATCH_ROWS = 100_000
+
+# table: (query, schema)
+TABLES = {"daily_track_plays": ("SELECT day, track, artist, album, plays FROM daily_track_plays "
+                                "WHERE user = ? ORDER BY day",
+                                pa.schema([("day", pa.string()),
+                                           ("Track", pa.string()),
+                                           ("Artist", pa.string()),
+                                           ("Album", pa.string()),
+                                           ("plays", pa.int64())])),
+          "daily_artist_plays": ("SELECT day, artist, plays FROM daily_artist_plays WHERE user = ? ORDER BY day",
+                                 pa.schema([("day", pa.string()),
+                                            ("Artist", pa.string()),
+                                            ("plays", pa.int64())]))}
+
+# table: (columns plays are summed per, name of the sum in the store's *_between frames)
+TOTALS = {"daily_track_plays": (["Track", "Artist", "Album"], "Streams"),
+          "daily_artist_plays": (["Artist"], "count")}
+
+### CLASSES ###
+class Snapshot:
+    """One user's memory-mapped rollup tables
+
+    `max_uts` is the newest scrobble they count. Days before `partial_from` (its
+    TIMEZONE day) are complete; anything from then on has to come from the store.
+    `scrobbles` is the store's row count when they were written: once it moves, even
+    by backfilled older rows, the snapshot is due for a rewrite.
+    """
+
+    def __init__(self, directory):
+        self.tables = {}
+        for table in TABLES:
+            with pa.memory_map(os.path.join(directory, f"{table}.arrow"), "r") as source:
+                self.tables[table] = pa.ipc.open_file(source).read_all()
+
+        metadata = self.tables["daily_artist_plays"].schema.metadata or {}
+        self.max_uts = int(metadata.get(b"max_uts", 0))
+        self.written_at = float(metadata.get(b"written_at", 0))
+        self.scrobbles = int(metadata.get(b"scrobbles", -1))
+        self.partial_from = scrobble_store.local_day(self.max_uts) if self.max_uts else "0000-00-00"
+
+    def rollup_between(self, table, start_day, end_day=None):
+        """Rows of a rollup over TIMEZONE days [start_day, end_day], limited to the complete days"""
+
+        rollup = self.tables[table]
+        days = rollup.column("day")
+        in_range = pc.and_(pc.greater_equal(days, str(start_day)), pc.less_equal(days, str(end_day or "9999-12-31")))
+
+        return rollup.filter(pc.and_(in_range, pc.less(days, self.partial_from)))
+
+### FUNCTIONS ###
+def snapshot_dir(user, directory=SNAPSHOT_DIR):
+    return os.path.join(directory, hashlib.sha1(user.encode()).hexdigest()[:16])
+
+def write_snapshot(conn, user, directory=SNAPSHOT_DIR):
+    """Rewrites `user`'s snapshot from the store; returns the newest scrobble it counts
+
+    Rows are streamed a batch at a time, and each file is written next to its target
+    and renamed over it, so a reader maps either the old file or the new one.
+    """
+
+    directory = snapshot_dir(user, directory)
+    os.makedirs(directory, exist_ok=True)
+    # read first: a sync landing mid-write only adds to days from local_day(max_uts) on,
+    # which readers take from the store anyway, and leaves the count behind - so the
+    # next check rewrites
+    max_uts = scrobble_store.high_water_mark(conn, user) or 0
+    metadata = {"max_uts": str(max_uts),
+                "scrobbles": str(scrobble_store.scrobble_count(conn, user)),
+                "written_at": str(time.time())}
+
+    for table, (query, schema) in TABLES.items():
+        schema = schema.with_metadata(metadata)
+        path = os.path.join(directory, f"{table}.arrow")
+        tmp = f"{path}.tmp"
+        cursor = conn.execute(query, (user,))
+
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            while rows := cursor.fetchmany(BATCH_ROWS):
+                columns = list(zip(*rows))
+                writer.write_batch(pa.record_batch([pa.array(column, type=field.type)
+                                                    for column, field in zip(columns, schema)], schema=schema))
+
+        os.replace(tmp, path)
+
+    return max_uts
+
+@functools.lru_cache(maxsize=32)
+def _open(directory, mtime_ns):
+    return Snapshot(directory)
+
+def open_snapshot(user, directory=SNAPSHOT_DIR):
+    """The user's current snapshot (None if there isn't one), re-mapped only when rewritten"""
+
+    directory = snapshot_dir(user, directory)
+
+    try:
+        mtime_ns = max(os.stat(os.path.join(directory, f"{table}.arrow")).st_mtime_ns for table in TABLES)
+    except FileNotFoundError:
+        return None
+
+    return _open(directory, mtime_ns)
+
+def totals(rollup, table):
+    """Plays summed per track or artist over a rollup slice, named like the store's *_between frames"""
+
+    keys, plays = TOTALS[table]
+    summed = rollup.group_by(keys).aggregate([("plays", "sum")])
+
+    return pd.DataFrame({**{key: summed.column(key).to_pandas() for key in keys},
+                         plays: summed.column("plays_sum").to_pandas()})
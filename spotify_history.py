@@ -0,0 +1,79 @@
+import threading
+
+import spotipy
+
+import scrobble_store
+import spotify_session
+
+### CONSTANTS ###
+PAGE_SIZE = 50
+# spotify only remembers the last 50 plays (~2-3 hours); poll well inside that
+POLL_INTERVAL = 10 * 60
+
+_ACCUMULATORS = {}
+_LOCK = threading.Lock()
+
+### CLASSES ###
+class Accumulator(threading.Thread):
+    """Background thread that keeps appending a user's new Spotify plays to the store"""
+
+    def __init__(self, oauth, token_info, conn, user):
+        super().__init__(name=f"spotify-history-{user}", daemon=True)
+        self.oauth = oauth
+        self.token_info = token_info
+        self.conn = conn
+        self.user = user
+        self._stop_event = threading.Event()
+
+    def update_token(self, token_info):
+        self.token_info = token_info
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.token_info = spotify_session.refresh_if_expiring(self.oauth, self.token_info)
+                spotify = spotipy.Spotify(auth=self.token_info["access_token"])
+                sync_recently_played(spotify, self.conn, self.user)
+            except Exception as e:
+                print(f"Error syncing Spotify plays for {self.user}: {e}")
+
+            self._stop_event.wait(POLL_INTERVAL)
+
+    def stop(self):
+        self._stop_event.set()
+
+### FUNCTIONS ###
+def sync_recently_played(spotify, conn, user):
+    """Appends plays newer than the stored high-water mark, following the `after` cursor"""
+
+    after = scrobble_store.spotify_high_water_mark(conn, user) or 0
+    inserted = 0
+
+    while True:
+        items = spotify.current_user_recently_played(limit=PAGE_SIZE, after=after)["items"]
+        if not items:
+            break
+
+        inserted += scrobble_store.insert_spotify_plays(conn, user, items)
+        newest = scrobble_store.spotify_high_water_mark(conn, user)
+
+        if len(items) < PAGE_SIZE or newest == after:
+            break
+        after = newest
+
+    return inserted
+
+def start_accumulator(oauth, token_info, conn, user):
+    """Starts (once per process) the background accumulator for `user`, or hands it a newer token"""
+
+    with _LOCK:
+        accumulator = _ACCUMULATORS.get(user)
+
+        if accumulator is None or not accumulator.is_alive():
+            accumulator = Accumulator(oauth, token_info, conn, user)
+            _ACCUMULATORS[user] = accumulator
+            accumulator.start()
+        else:
+            accumulator.update_token(token_info)
+
+    return accumulator
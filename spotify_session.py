@@ -0,0 +1,48 @@
+import time
+
+import spotipy
+
+### CONSTANTS ###
+# refresh a little early so a token never expires mid-rerun
+EXPIRY_MARGIN = 60
+
+### FUNCTIONS ###
+def get_token(oauth, session_state, code):
+    """Access token for this browser session, cached in st.session_state
+
+    The login `code` is exchanged once; after that the cached token is reused
+    until it is about to expire, when it is renewed with the refresh token.
+    """
+
+    token_info = session_state.get("spotify_token")
+
+    if token_info is None or session_state.get("spotify_code") != code:
+        token_info = oauth.get_access_token(code, as_dict=True)
+        session_state["spotify_code"] = code
+
+    else:
+        token_info = refresh_if_expiring(oauth, token_info)
+
+    session_state["spotify_token"] = token_info
+
+    return token_info
+
+def refresh_if_expiring(oauth, token_info):
+    """Renews `token_info` with its refresh token if it expires within EXPIRY_MARGIN"""
+
+    if token_info["expires_at"] - time.time() < EXPIRY_MARGIN:
+        return oauth.refresh_access_token(token_info["refresh_token"])
+
+    return token_info
+
+def get_client(session_state, token_info):
+    """(Spotify client, current_user dict), rebuilt only when the access token changes"""
+
+    cached = session_state.get("spotify_client")
+
+    if cached is None or cached[0] != token_info["access_token"]:
+        spotify = spotipy.Spotify(auth=token_info["access_token"])
+        cached = (token_info["access_token"], spotify, spotify.current_user())
+        session_state["spotify_client"] = cached
+
+    return cached[1], cached[2]
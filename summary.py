@@ -0,0 +1,37 @@
+import plotly.graph_objects as go
+import streamlit as st
+
+import data_layer
+
+### FUNCTIONS ###
+def render(user, week_start):
+    """The last.fm Summary pane: today's, this week's and all-time stats, and minutes per day"""
+
+    stats = data_layer.listening_stats(user, week_start)
+    today = stats["today"]
+
+    st.markdown(f"### You listened to {today['unique_tracks']:,} unique songs today, "
+                f"by {today['unique_artists']:,} unique artists")
+
+    for label, window, approx in [("Today", "today", ""),
+                                  (f"Since {week_start.date()}", "week", ""),
+                                  ("All time", "all_time", "~")]:
+        st.markdown(f"#### {label}")
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Scrobbles", f"{stats[window]['scrobbles']:,}")
+        col2.metric("Unique songs", f"{approx}{stats[window]['unique_tracks']:,}")
+        col3.metric("Unique artists", f"{approx}{stats[window]['unique_artists']:,}")
+        col4.metric("Time listened", f"{stats[window]['seconds'] / 3600:,.1f} h")
+
+    daily = stats["daily"]
+    fig = go.Figure(data=[go.Bar(x=daily["day"],
+                                 y=daily["seconds"] / 60,
+                                 customdata=daily[["unique_tracks", "unique_artists"]],
+                                 hovertemplate=('<b>%{x}</b><br>'
+                                                'Minutes: %{y:.0f}<br>'
+                                                'Unique songs: %{customdata[0]}<br>'
+                                                'Unique artists: %{customdata[1]}<br>'
+                                                '<extra></extra>'))])
+    fig.update_layout(title="Minutes Listened per Day")
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption("Listening time is estimated from the gaps between scrobbles; all-time unique counts are approximate.")
@@ -0,0 +1,142 @@
+import threading
+import time
+
+import scrobble_store
+
+### CONSTANTS ###
+MAX_WORKERS = 4
+# pages a user may take per turn before yielding to the next user in line
+PAGES_PER_TURN = 5
+
+# a user with a dashboard open within ACTIVE_WINDOW is synced every ACTIVE_INTERVAL
+ACTIVE_WINDOW = 5 * 60
+ACTIVE_INTERVAL = 60
+IDLE_INTERVAL = 30 * 60
+
+### CLASSES ###
+class SyncScheduler:
+    """Runs incremental user.getRecentTracks syncs for many users on a worker pool
+
+    Every request goes through the process-wide last.fm rate limiter, so adding
+    users or workers never raises the request rate - it just shares the budget.
+    Sharing is fair because a turn is capped at PAGES_PER_TURN pages: a user with a
+    large backlog is requeued behind everyone else who is due. Among due users,
+    those with an active dashboard session go first.
+    """
+
+    def __init__(self, conn, lastfm_get, since=None, workers=MAX_WORKERS, pages_per_turn=PAGES_PER_TURN,
+                 standby=None):
+        self.conn = conn
+        self.lastfm_get = lastfm_get
+        # while standby() is true another process is syncing; turns are skipped, not taken
+        self.standby = standby
+        # where a user's first sync starts; the current week unless told otherwise
+        self.since = since or (lambda user: scrobble_store.week_start().timestamp())
+        self.workers = workers
+        self.pages_per_turn = pages_per_turn
+
+        self._due = {}
+        self._claimed = set()
+        self._last_active = {}
+        self._last_synced = {}
+        self._cond = threading.Condition()
+        self._running = False
+        self._threads = []
+
+    def add_user(self, user):
+        """Queues a user for syncing (no-op if already known)"""
+
+        with self._cond:
+            if user not in self._due and user not in self._claimed:
+                self._due[user] = time.time()
+                self._cond.notify()
+
+    def mark_active(self, user):
+        """Called on every dashboard rerun: puts the user ahead of idle users
+
+        Only priority changes - an active user is due ACTIVE_INTERVAL after its last
+        sync rather than IDLE_INTERVAL, not on every rerun. Users never synced (or not
+        known yet) are due right away.
+        """
+
+        with self._cond:
+            now = time.time()
+            self._last_active[user] = now
+            if user not in self._claimed:
+                synced_at = self._last_synced.get(user)
+                due = now if synced_at is None else synced_at + ACTIVE_INTERVAL
+                self._due[user] = min(self._due.get(user, now), due)
+                self._cond.notify()
+
+    def last_synced(self, user):
+        """When the user's last completed sync finished (None if never)"""
+
+        return self._last_synced.get(user)
+
+    def is_active(self, user):
+        return time.time() - self._last_active.get(user, 0) < ACTIVE_WINDOW
+
+    def start(self):
+        self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"sync-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+        for thread in self._threads:
+            thread.join()
+
+    def _next_user(self):
+        """Blocks until a user is due; active users first, then whoever has waited longest"""
+
+        with self._cond:
+            while self._running:
+                now = time.time()
+                due = [user for user, at in self._due.items() if at <= now]
+
+                if due:
+                    user = min(due, key=lambda user: (not self.is_active(user), self._due[user]))
+                    # claimed users leave the queue, so no two workers sync the same user
+                    del self._due[user]
+                    self._claimed.add(user)
+                    return user
+
+                wait = min(self._due.values(), default=now + IDLE_INTERVAL) - now
+                self._cond.wait(timeout=max(wait, 0.1))
+
+        return None
+
+    def _work(self):
+        while (user := self._next_user()) is not None:
+            if self.standby is not None and self.standby():
+                with self._cond:
+                    self._claimed.discard(user)
+                    self._due[user] = time.time() + ACTIVE_INTERVAL
+                continue
+
+            complete = True
+
+            try:
+                _, complete = scrobble_store.sync_recent_tracks(self.conn, self.lastfm_get, user, self.since(user),
+                                                                max_pages=self.pages_per_turn)
+            except Exception as e:
+                print(f"Error syncing {user}: {e}")
+
+            with self._cond:
+                self._claimed.discard(user)
+                now = time.time()
+                if complete:
+                    self._last_synced[user] = now
+                    interval = ACTIVE_INTERVAL if self.is_active(user) else IDLE_INTERVAL
+                    self._due[user] = now + interval
+                else:
+                    # more pages waiting: go to the back of the currently-due line
+                    self._due[user] = now
+                self._cond.notify()
@@ -0,0 +1,172 @@
+"""Long-running sync worker that keeps the scrobble store and caches warm
+
+    python sync_worker.py --users jasminexx18 someone_else
+
+While it runs (its heartbeat is fresh), the dashboards only read local state:
+scrobbles and rollups from the store (and the Arrow snapshots of the rollups
+written here), top-track snapshots, cached tags, track durations and cover art.
+They fall back to fetching inline when no worker is running.
+"""
+import argparse
+import threading
+import time
+
+import coverart
+import durations
+import metrics
+import range_index
+import scrobble_store
+import snapshot
+import sync_scheduler
+import tags
+from lastfm_client import lastfm_get
+from rate_limit import LASTFM_LIMITER
+
+### CONSTANTS ###
+LASTFM_PERIODS = ["7day", "1month", "3month", "6month", "12month", "overall"]
+
+POLL_INTERVAL = 15
+TOP_TRACKS_INTERVAL = 60 * 60
+TAGS_INTERVAL = 10 * 60
+DURATIONS_INTERVAL = 6 * 60 * 60
+COVERART_INTERVAL = 6 * 60 * 60
+SNAPSHOT_INTERVAL = 15 * 60
+# a worker whose heartbeat is older than this is considered gone
+HEARTBEAT_TIMEOUT = 2 * 60
+HEARTBEAT_INTERVAL = 30
+# dashboard users are kept in the rotation for a week after their last visit
+RETAIN_USERS = 7 * 24 * 60 * 60
+
+### FUNCTIONS ###
+def worker_is_live(conn):
+    """Whether a sync worker has checked in recently"""
+
+    heartbeat = scrobble_store.last_synced(conn, "*", "worker")
+
+    return heartbeat is not None and time.time() - heartbeat < HEARTBEAT_TIMEOUT
+
+def sync_top_tracks(conn, user):
+    """Snapshots user.getTopTracks for every period"""
+
+    for period in LASTFM_PERIODS:
+        LASTFM_LIMITER.acquire()
+        r = lastfm_get({'method': 'user.getTopTracks',
+                        'user': user,
+                        'period': period})
+        scrobble_store.save_top_tracks(conn, user, period, r.json()["toptracks"]["track"])
+
+    scrobble_store.record_sync(conn, user, "top_tracks")
+
+def sync_tags(conn, user):
+    """Resolves tags for this week's tracks into the shared tag cache"""
+
+    week = scrobble_store.top_tracks_between(conn, user, scrobble_store.week_start().date())
+    pairs = list(zip(week["Track"], week["Artist"]))
+
+    # artist tags (with track fallbacks) back the default cloud; track tags the per-track one
+    tags.artist_tag_frequencies(lastfm_get, pairs, week["Streams"].tolist())
+    tags.get_tracks_top_tags(lastfm_get, pairs)
+
+    scrobble_store.record_sync(conn, user, "tags")
+
+def sync_durations(conn, user):
+    """Resolves lengths for the user's top tracks (every period) into the shared duration cache"""
+
+    for period in LASTFM_PERIODS:
+        top_tracks = scrobble_store.load_top_tracks(conn, user, period) or []
+        pairs = [(track["name"], track["artist"]["name"]) for track in top_tracks]
+        durations.get_track_durations(lastfm_get, pairs,
+                                      known={pair: track.get("duration") for pair, track in zip(pairs, top_tracks)})
+
+    scrobble_store.record_sync(conn, user, "durations")
+
+def sync_coverart(conn, user):
+    """Resolves cover art for the user's top tracks (every period) into the shared cover cache"""
+
+    for period in LASTFM_PERIODS:
+        top_tracks = scrobble_store.load_top_tracks(conn, user, period) or []
+        coverart.get_coverart([track.get("mbid") for track in top_tracks])
+
+    scrobble_store.record_sync(conn, user, "coverart")
+
+def sync_snapshot(conn, user):
+    """Rewrites the user's Arrow snapshot if scrobbles have been stored since the last one
+
+    Compared by row count rather than newest timestamp, so backfilled older scrobbles
+    (backfill.py --store) also bring the past days' totals up to date.
+    """
+
+    mapped = snapshot.open_snapshot(user)
+    if mapped is None or scrobble_store.scrobble_count(conn, user) != mapped.scrobbles:
+        snapshot.write_snapshot(conn, user)
+
+    scrobble_store.record_sync(conn, user, "snapshot")
+
+def is_due(conn, user, job, interval):
+    synced_at = scrobble_store.last_synced(conn, user, job)
+
+    return synced_at is None or time.time() - synced_at >= interval
+
+def beat(path=scrobble_store.STORE_PATH):
+    """Records the worker's heartbeat every HEARTBEAT_INTERVAL
+
+    Runs on its own thread and connection, so a long pass of cache warming (cover
+    art at one request a second, say) can't make the dashboards think the worker is gone.
+    """
+
+    conn = scrobble_store.connect(path)
+
+    while True:
+        scrobble_store.record_sync(conn, "*", "worker")
+        time.sleep(HEARTBEAT_INTERVAL)
+
+def run(users, workers):
+    conn = scrobble_store.connect()
+    threading.Thread(target=beat, name="heartbeat", daemon=True).start()
+    scheduler = sync_scheduler.SyncScheduler(conn, lastfm_get, workers=workers).start()
+    indexes = {}
+
+    while True:
+        now = time.time()
+        seen = scrobble_store.active_users(conn, now - RETAIN_USERS)
+
+        for user in set(users) | set(seen):
+            scheduler.add_user(user)
+            if now - seen.get(user, 0) < sync_scheduler.ACTIVE_WINDOW:
+                scheduler.mark_active(user)
+
+            try:
+                # the dashboards only map these while the worker is live
+                if user not in indexes:
+                    indexes[user] = range_index.RangeIndex("scrobbles", user)
+                indexes[user].refresh(conn)
+
+                if is_due(conn, user, "top_tracks", TOP_TRACKS_INTERVAL):
+                    sync_top_tracks(conn, user)
+                if is_due(conn, user, "tags", TAGS_INTERVAL):
+                    sync_tags(conn, user)
+                if is_due(conn, user, "durations", DURATIONS_INTERVAL):
+                    sync_durations(conn, user)
+                if is_due(conn, user, "coverart", COVERART_INTERVAL):
+                    sync_coverart(conn, user)
+                if is_due(conn, user, "snapshot", SNAPSHOT_INTERVAL):
+                    sync_snapshot(conn, user)
+            except Exception as e:
+                print(f"Error warming caches for {user}: {e}")
+
+        time.sleep(POLL_INTERVAL)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", nargs="*", default=[], help="last.fm users to always keep synced")
+    parser.add_argument("--workers", type=int, default=sync_scheduler.MAX_WORKERS)
+    parser.add_argument("--metrics-port", default=metrics.WORKER_METRICS_PORT,
+                        help="serve /metrics and /metrics.json on this port (not the dashboards' METRICS_PORT)")
+    args = parser.parse_args()
+
+    metrics.serve(args.metrics_port)
+
+    run(args.users, args.workers)
+
+if __name__ == "__main__":
+    main()
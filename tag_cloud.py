@@ -0,0 +1,61 @@
+import hashlib
+import io
+import json
+import threading
+from collections import Counter, OrderedDict
+
+from wordcloud import WordCloud
+
+### CONSTANTS ###
+WIDTH = 800
+HEIGHT = 400
+# rendered PNGs kept in memory; one per distinct frequency map
+MAX_IMAGES = 64
+
+_IMAGES = OrderedDict()
+_LOCK = threading.Lock()
+
+### FUNCTIONS ###
+def tag_frequencies(track_tags, pairs, streams=None):
+    """{tag: weight} over `pairs`, each track's tags weighted by its stream count if given"""
+
+    frequencies = Counter()
+
+    for i, pair in enumerate(pairs):
+        weight = streams[i] if streams is not None else 1
+        for tag in track_tags.get(pair, []):
+            frequencies[tag] += weight
+
+    return dict(frequencies)
+
+def frequencies_key(frequencies):
+    return hashlib.sha1(json.dumps(sorted(frequencies.items())).encode()).hexdigest()
+
+def render_png(frequencies):
+    """PNG bytes of the word cloud for a frequency map (None if there are no tags)
+
+    Goes straight from counts to an image - no re-tokenizing a joined string, no
+    pyplot - and an unchanged map returns the already-rendered PNG.
+    """
+
+    if not frequencies:
+        return None
+
+    key = frequencies_key(frequencies)
+
+    with _LOCK:
+        if key in _IMAGES:
+            _IMAGES.move_to_end(key)
+            return _IMAGES[key]
+
+    image = WordCloud(width=WIDTH, height=HEIGHT).generate_from_frequencies(frequencies).to_image()
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    png = buffer.getvalue()
+
+    with _LOCK:
+        _IMAGES[key] = png
+        while len(_IMAGES) > MAX_IMAGES:
+            _IMAGES.popitem(last=False)
+
+    return png
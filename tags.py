@@ -0,0 +1,114 @@
+from collections import Counter
+
+from disk_cache import DiskCache
+from rate_limit import LASTFM_LIMITER
+
+### CONSTANTS ###
+REMOVE_TAGS = ["seen live", "love", "favorites", "favorite", 'favorite songs']
+
+DAY = 24 * 60 * 60
+# tags barely move, untagged tracks occasionally pick some up
+TAG_TTL = 30 * DAY
+NO_TAG_TTL = 3 * DAY
+MAX_ENTRIES = 50_000
+MAX_WORKERS = 4
+# artists carry long tag tails; the head is what describes them
+MAX_ARTIST_TAGS = 10
+
+# last.fm error 6: "Track/Artist not found" - as final as an empty tag list
+NOT_FOUND = 6
+
+TRACK_TAGS = DiskCache("track_tags", TAG_TTL, MAX_ENTRIES, negative_ttl=NO_TAG_TTL)
+ARTIST_TAGS = DiskCache("artist_tags", TAG_TTL, MAX_ENTRIES, negative_ttl=NO_TAG_TTL)
+
+### FUNCTIONS ###
+def normalize_key(*parts):
+    """Cache key that ignores case and stray whitespace"""
+
+    return "\x1f".join(" ".join(str(part).split()).casefold() for part in parts)
+
+def _clean(data, key):
+    """Tag names from a *.getTopTags response, minus the non-genre ones in REMOVE_TAGS"""
+
+    if data.get("error") == NOT_FOUND:
+        return []
+    if "error" in data:
+        raise RuntimeError(f"last.fm error {data['error']}: {data.get('message')}")
+
+    tags = data[key]["tag"]
+    tags = [tag["name"].lower() for tag in tags] if len(tags) else []
+    tags = [tag for tag in tags if tag not in REMOVE_TAGS]
+
+    return tags
+
+def get_track_top_tags(lastfm_get, track, artist):
+    """Fetches a track's top tags (uncached)"""
+
+    LASTFM_LIMITER.acquire()
+    r = lastfm_get({'method': 'track.getTopTags',
+                    'artist': artist,
+                    'track': track})
+
+    return _clean(r.json(), "toptags")
+
+def get_artist_top_tags(lastfm_get, artist):
+    """Fetches an artist's top MAX_ARTIST_TAGS tags (uncached)"""
+
+    LASTFM_LIMITER.acquire()
+    r = lastfm_get({'method': 'artist.getTopTags',
+                    'artist': artist})
+
+    return _clean(r.json(), "toptags")[:MAX_ARTIST_TAGS]
+
+def _cached_lookup(cache, keys, fetch, fetch_misses):
+    """{item: tags} for every item in `keys` ({item: cache key}); untagged items are negative entries"""
+
+    found = cache.lookup(keys, lambda item: fetch(item) or None, fetch_misses, max_workers=MAX_WORKERS)
+
+    return {item: tags or [] for item, tags in found.items()}
+
+def get_tracks_top_tags(lastfm_get, pairs, fetch_misses=True):
+    """Returns {(track, artist): tags}, only asking last.fm about cache misses
+
+    Misses are resolved concurrently; tracks without tags are cached as negative
+    entries so they aren't looked up again until NO_TAG_TTL passes. With
+    `fetch_misses=False` nothing is requested and misses come back empty.
+    """
+
+    keys = {pair: normalize_key(pair[1], pair[0]) for pair in pairs}
+
+    return _cached_lookup(TRACK_TAGS, keys, lambda pair: get_track_top_tags(lastfm_get, *pair), fetch_misses)
+
+def get_artists_top_tags(lastfm_get, artists, fetch_misses=True):
+    """Returns {artist: tags}, cached the same way as get_tracks_top_tags"""
+
+    keys = {artist: normalize_key(artist) for artist in artists}
+
+    return _cached_lookup(ARTIST_TAGS, keys, lambda artist: get_artist_top_tags(lastfm_get, artist), fetch_misses)
+
+def artist_tag_frequencies(lastfm_get, pairs, streams, fetch_misses=True):
+    """{tag: weight} resolved per artist rather than per track
+
+    Tags are looked up once per distinct artist and weighted by that artist's total
+    streams, so the request count scales with artists, not tracks. Only artists
+    last.fm has no tags for fall back to their tracks' own tags.
+    """
+
+    artist_streams = Counter()
+    for (track, artist), count in zip(pairs, streams):
+        artist_streams[artist] += count
+
+    artist_tags = get_artists_top_tags(lastfm_get, artist_streams, fetch_misses=fetch_misses)
+
+    untagged = [(pair, count) for pair, count in zip(pairs, streams) if not artist_tags[pair[1]]]
+    track_tags = get_tracks_top_tags(lastfm_get, [pair for pair, _ in untagged], fetch_misses=fetch_misses)
+
+    frequencies = Counter()
+    for artist, count in artist_streams.items():
+        for tag in artist_tags[artist]:
+            frequencies[tag] += count
+    for pair, count in untagged:
+        for tag in track_tags[pair]:
+            frequencies[tag] += count
+
+    return dict(frequencies)
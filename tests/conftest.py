@@ -0,0 +1,60 @@
+"""Shared fixtures: a throwaway store and a fake last.fm built from benchmark.py's synthetic pages"""
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+import scrobble_store
+
+### CLASSES ###
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+class FakeLastfm:
+    """Serves user.getRecentTracks pages like last.fm: page 1 is the newest
+
+    `calls` records every requested page, so tests can check what was fetched.
+    """
+
+    def __init__(self, size, seed=benchmark.SEED):
+        rng = np.random.default_rng(seed)
+        self.pages = list(benchmark.recent_tracks_pages(size, rng, benchmark.catalogue(size, rng)))
+        self.calls = []
+
+    def __call__(self, params):
+        self.calls.append(params["page"])
+
+        return FakeResponse(self.pages[params["page"] - 1])
+
+    def tracks(self):
+        """Every served track, oldest first"""
+
+        return [track for page in reversed(self.pages) for track in reversed(json.loads(page)["recenttracks"]["track"])]
+
+class NoLimit:
+    def acquire(self):
+        pass
+
+### FIXTURES ###
+@pytest.fixture
+def store(tmp_path):
+    conn = scrobble_store.connect(str(tmp_path / "scrobbles.db"))
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def fake_lastfm():
+    return FakeLastfm
+
+@pytest.fixture
+def no_limit():
+    return NoLimit()
@@ -0,0 +1,128 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import data_layer
+
+USER = "user"
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, "time", clock)
+
+    return clock
+
+@pytest.fixture
+def memo(monkeypatch):
+    memo = data_layer.Memo()
+    monkeypatch.setattr(data_layer, "MEMO", memo)
+
+    return memo
+
+def counter():
+    calls = []
+
+    def compute():
+        calls.append(None)
+        return len(calls)
+
+    return compute, calls
+
+def test_entries_live_for_their_ttl(memo, clock):
+    compute, calls = counter()
+    key = (USER, "method", None, None, None)
+
+    assert memo.get_or_compute(key, 60, compute) == 1
+    clock.now += 59
+    assert memo.get_or_compute(key, 60, compute) == 1
+    clock.now += 1
+    assert memo.get_or_compute(key, 60, compute) == 2
+    assert len(calls) == 2
+
+def test_expired_entries_and_their_locks_are_pruned(memo, clock):
+    compute, _ = counter()
+    for week in range(10):
+        memo.get_or_compute((USER, "method", None, week, None), 60, compute)
+
+    clock.now += 61
+    memo.get_or_compute((USER, "method", None, "this week", None), 60, compute)
+
+    assert list(memo._entries) == [(USER, "method", None, "this week", None)]
+    assert list(memo._locks) == [(USER, "method", None, "this week", None)]
+
+def test_invalidate_by_user_and_method(memo, clock):
+    compute, _ = counter()
+    for user in ("a", "b"):
+        for method in ("tracks", "artists"):
+            memo.get_or_compute((user, method, None, None, None), 60, compute)
+
+    memo.invalidate(user="a", method="tracks")
+    assert sorted(key[:2] for key in memo._entries) == [("a", "artists"), ("b", "artists"), ("b", "tracks")]
+
+    memo.invalidate(user="b")
+    assert sorted(key[:2] for key in memo._entries) == [("a", "artists")]
+
+    memo.invalidate()
+    assert not memo._entries
+
+def test_concurrent_callers_share_one_computation(memo):
+    calls = []
+    started = threading.Event()
+
+    def compute():
+        calls.append(None)
+        started.set()
+        time.sleep(0.1)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(memo.get_or_compute("key", 60, compute)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["value"] * 8
+    assert len(calls) == 1
+
+def test_memoized_keys_on_user_period_week_and_inputs(memo):
+    calls = []
+
+    @data_layer.memoized("method", ttl=60, inputs=("pairs",))
+    def compute(client, user, period, pairs, week_start=None):
+        calls.append((user, period, pairs))
+        return len(calls)
+
+    assert compute("client", USER, "7day", [1]) == 1
+    # clients aren't part of the key
+    assert compute("another client", USER, "7day", [1]) == 1
+    assert compute("client", USER, "7day", [1], week_start=None) == 1
+
+    assert compute("client", "someone else", "7day", [1]) == 2
+    assert compute("client", USER, "overall", [1]) == 3
+    assert compute("client", USER, "7day", [1, 2]) == 4
+    assert compute("client", USER, "7day", [1], week_start="monday") == 5
+
+def test_memoized_values_are_deep_copies(memo):
+    @data_layer.memoized("method", ttl=60)
+    def stats(user):
+        return {"scrobbles": 3, "daily": pd.DataFrame({"day": ["2024-03-01"], "scrobbles": [3]})}
+
+    first = stats(USER)
+    first["scrobbles"] = 0
+    first["daily"].loc[0, "scrobbles"] = 0
+
+    second = stats(USER)
+    assert second["scrobbles"] == 3
+    assert second["daily"].loc[0, "scrobbles"] == 3
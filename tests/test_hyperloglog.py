@@ -0,0 +1,47 @@
+import pytest
+
+import hyperloglog
+
+def values(n, prefix="value"):
+    return [f"{prefix} {i}" for i in range(n)]
+
+@pytest.mark.parametrize("n", [100, 10_000, 100_000])
+def test_count_is_within_the_error_bound(n):
+    sketch = hyperloglog.HyperLogLog()
+    sketch.add_many(values(n))
+
+    # about 1.6% standard error at the default precision; 5% is over three of them
+    assert sketch.count() == pytest.approx(n, rel=0.05)
+
+def test_empty_sketch_counts_zero():
+    assert hyperloglog.HyperLogLog().count() == 0
+
+def test_adding_again_changes_nothing():
+    sketch = hyperloglog.HyperLogLog()
+    sketch.add_many(values(5_000))
+    registers = sketch.to_bytes()
+
+    sketch.add_many(values(5_000))
+    sketch.add_many(values(2_000))
+
+    assert sketch.to_bytes() == registers
+
+def test_batches_merge_like_one():
+    whole, batched = hyperloglog.HyperLogLog(), hyperloglog.HyperLogLog()
+    whole.add_many(values(10_000))
+    for start in range(0, 10_000, 3_000):
+        batched.add_many(values(10_000)[start:start + 3_000])
+
+    assert batched.to_bytes() == whole.to_bytes()
+
+def test_round_trips_through_bytes():
+    sketch = hyperloglog.HyperLogLog()
+    sketch.add_many(values(10_000))
+    blob = sketch.to_bytes()
+
+    restored = hyperloglog.HyperLogLog(blob)
+    restored.add_many(values(100, prefix="more"))
+
+    assert len(blob) == 1 << hyperloglog.PRECISION
+    assert hyperloglog.HyperLogLog(blob).count() == sketch.count()
+    assert restored.count() > sketch.count()
@@ -0,0 +1,53 @@
+import pagination
+
+def uts_of(pages):
+    return [int(track["date"]["uts"]) for page in pages for track in page]
+
+def test_pages_come_back_oldest_first(fake_lastfm, no_limit):
+    lastfm = fake_lastfm(1_000)
+
+    pages, complete = pagination.fetch_recent_tracks(lastfm, "user", 0, limiter=no_limit)
+
+    assert complete
+    assert len(pages) == len(lastfm.pages)
+    # within a page last.fm lists newest first, so compare page by page
+    firsts = [int(page[-1]["date"]["uts"]) for page in pages]
+    assert firsts == sorted(firsts)
+    assert sorted(uts_of(pages)) == [int(track["date"]["uts"]) for track in lastfm.tracks()]
+
+def test_each_page_is_fetched_once(fake_lastfm, no_limit):
+    lastfm = fake_lastfm(1_000)
+
+    pagination.fetch_recent_tracks(lastfm, "user", 0, limiter=no_limit)
+
+    assert lastfm.calls[0] == 1
+    assert sorted(lastfm.calls) == list(range(1, len(lastfm.pages) + 1))
+
+def test_max_pages_returns_the_oldest_pages(fake_lastfm, no_limit):
+    lastfm = fake_lastfm(1_000)
+
+    pages, complete = pagination.fetch_recent_tracks(lastfm, "user", 0, limiter=no_limit, max_pages=2)
+
+    assert not complete
+    assert len(pages) == 2
+    # the oldest scrobbles, with nothing skipped before them
+    oldest = [int(track["date"]["uts"]) for track in lastfm.tracks()]
+    assert sorted(uts_of(pages)) == oldest[:len(uts_of(pages))]
+
+def test_max_pages_covering_everything_is_complete(fake_lastfm, no_limit):
+    lastfm = fake_lastfm(1_000)
+
+    pages, complete = pagination.fetch_recent_tracks(lastfm, "user", 0, limiter=no_limit,
+                                                     max_pages=len(lastfm.pages))
+
+    assert complete
+    assert len(pages) == len(lastfm.pages)
+
+def test_single_page(fake_lastfm, no_limit):
+    lastfm = fake_lastfm(50)
+
+    pages, complete = pagination.fetch_recent_tracks(lastfm, "user", 0, limiter=no_limit, max_pages=1)
+
+    assert complete
+    assert lastfm.calls == [1]
+    assert len(pages[0]) == 50
@@ -0,0 +1,94 @@
+from datetime import datetime
+
+import numpy as np
+
+import ingest
+import range_index
+import scrobble_store
+
+USER = "user"
+
+def index(tmp_path):
+    return range_index.RangeIndex("scrobbles", USER, directory=str(tmp_path / "index"))
+
+def meta(idx):
+    return idx._read_meta()
+
+def stored_uts(conn, start=None, end=None, descending=True):
+    rows = conn.execute("SELECT uts FROM scrobbles WHERE user = ? AND uts >= ? AND uts < ? "
+                        f"ORDER BY uts {'DESC' if descending else 'ASC'}",
+                        (USER, start or 0, end or 2 ** 62)).fetchall()
+
+    return [row[0] for row in rows]
+
+def moment(uts):
+    return datetime.fromtimestamp(uts, range_index.TIMEZONE)
+
+def test_later_rows_are_appended_in_place(store, fake_lastfm, tmp_path):
+    tracks = fake_lastfm(1_000).tracks()
+    idx = index(tmp_path)
+
+    scrobble_store.insert_scrobbles(store, USER, ingest.recent_tracks_to_columns(tracks[:600]))
+    assert idx.refresh(store) == 600
+    scrobble_store.insert_scrobbles(store, USER, ingest.recent_tracks_to_columns(tracks[600:]))
+    assert idx.refresh(store) == 400
+    assert idx.refresh(store) == 0
+
+    assert meta(idx)["generation"] == 0
+    assert idx.count() == 1_000
+    assert np.all(np.diff(idx.times) >= 0)
+
+def test_backfill_rewrites_under_a_new_generation(store, fake_lastfm, tmp_path):
+    tracks = fake_lastfm(1_000).tracks()
+    idx = index(tmp_path)
+
+    scrobble_store.insert_scrobbles(store, USER, ingest.recent_tracks_to_columns(tracks[500:]))
+    idx.refresh(store)
+    old_times = idx.times
+    before = old_times.tolist()
+
+    scrobble_store.insert_scrobbles(store, USER, ingest.recent_tracks_to_columns(tracks[:500]))
+    idx.refresh(store)
+
+    assert meta(idx)["generation"] == 1
+    assert idx.times.tolist() == stored_uts(store, descending=False)
+    # a reader still holding the old mapping sees the old rows, unchanged
+    assert old_times.tolist() == before
+
+    # another process picks the new generation up from the metadata
+    assert index(tmp_path).times.tolist() == idx.times.tolist()
+
+def test_ranges_and_pages_match_the_store(store, fake_lastfm, tmp_path):
+    tracks = fake_lastfm(1_000).tracks()
+    scrobble_store.insert_scrobbles(store, USER, ingest.recent_tracks_to_columns(tracks))
+    idx = index(tmp_path)
+    idx.refresh(store)
+
+    uts = stored_uts(store, descending=False)
+    start, end = uts[100], uts[900]
+    in_range = stored_uts(store, start, end)
+
+    assert idx.count(moment(start), moment(end)) == len(in_range) == 800
+    assert idx.count() == 1_000
+
+    rowids = idx.rowids_between(moment(start), moment(end), offset=50, limit=25)
+    page = scrobble_store.read_rows(store, "scrobbles", rowids)
+    assert page["uts"].tolist() == in_range[50:75]
+
+    rowids = idx.rowids_between(moment(start), moment(end), offset=790, limit=25, descending=False)
+    page = scrobble_store.read_rows(store, "scrobbles", rowids)
+    assert page["uts"].tolist() == in_range[::-1][790:]
+
+def test_daily_counts_match_daily_stats(store, fake_lastfm, tmp_path):
+    scrobble_store.insert_scrobbles(store, USER, ingest.recent_tracks_to_columns(fake_lastfm(2_000).tracks()))
+    idx = index(tmp_path)
+    idx.refresh(store)
+
+    stats = scrobble_store.daily_stats(store, USER, "0000-00-00")
+    first, last = (datetime.strptime(day, "%Y-%m-%d").date() for day in (stats["day"].iloc[0], stats["day"].iloc[-1]))
+    start, end = range_index.date_range_bounds(first, last)
+
+    counts = idx.daily_counts(start, end)
+
+    assert {str(day): plays for day, plays in counts.items()} == dict(zip(stats["day"], stats["scrobbles"]))
+    assert len(counts) == len(stats)
@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmark
+import ingest
+import scrobble_store
+
+USER = "user"
+
+def columns(tracks):
+    return ingest.recent_tracks_to_columns(tracks)
+
+def rollups(conn):
+    return {"daily_stats": scrobble_store.daily_stats(conn, USER, "0000-00-00"),
+            "top_tracks": scrobble_store.top_tracks_between(conn, USER, "0000-00-00"),
+            "artist_plays": scrobble_store.artist_plays_between(conn, USER, "0000-00-00"),
+            "stats": scrobble_store.stats_between(conn, USER, None)}
+
+def assert_same_rollups(left, right):
+    for name in ("daily_stats", "top_tracks", "artist_plays"):
+        pd.testing.assert_frame_equal(left[name], right[name], check_dtype=False)
+    assert left["stats"] == right["stats"]
+
+def test_insert_skips_duplicates(store, fake_lastfm):
+    tracks = fake_lastfm(500).tracks()
+
+    assert scrobble_store.insert_scrobbles(store, USER, columns(tracks)) == 500
+    assert scrobble_store.insert_scrobbles(store, USER, columns(tracks)) == 0
+    assert scrobble_store.insert_scrobbles(store, USER, columns(tracks[:300] + tracks[:300])) == 0
+    assert scrobble_store.scrobble_count(store, USER) == 500
+    assert scrobble_store.stats_between(store, USER, None)["scrobbles"] == 500
+
+def test_watermarks(store, fake_lastfm):
+    tracks = fake_lastfm(500).tracks()
+    uts = [int(track["date"]["uts"]) for track in tracks]
+
+    assert scrobble_store.high_water_mark(store, USER) is None
+    scrobble_store.insert_scrobbles(store, USER, columns(tracks))
+
+    assert scrobble_store.high_water_mark(store, USER) == max(uts)
+    assert scrobble_store.low_water_mark(store, USER) == min(uts)
+
+def test_incremental_rollups_match_a_full_rebuild(store, fake_lastfm):
+    tracks = fake_lastfm(3_000).tracks()
+
+    # newest history first, then a backfill of the oldest, then the middle: every batch
+    # but the first lands next to days that already have stats
+    for batch in (tracks[2_000:], tracks[:700], tracks[700:2_000]):
+        scrobble_store.insert_scrobbles(store, USER, columns(batch))
+    incremental = rollups(store)
+
+    scrobble_store.rebuild_rollups(store, USER)
+
+    assert_same_rollups(incremental, rollups(store))
+    assert incremental["stats"]["scrobbles"] == 3_000
+    assert incremental["daily_stats"]["scrobbles"].sum() == 3_000
+
+def test_daily_stats_count_listening_time(store, fake_lastfm):
+    tracks = fake_lastfm(1_000).tracks()
+    scrobble_store.insert_scrobbles(store, USER, columns(tracks))
+
+    # synthetic scrobbles are SECONDS_PER_SCROBBLE apart, well under MAX_GAP; the newest
+    # one has no successor and counts DEFAULT_TRACK_SECONDS
+    expected = 999 * benchmark.SECONDS_PER_SCROBBLE + scrobble_store.DEFAULT_TRACK_SECONDS
+
+    assert scrobble_store.daily_stats(store, USER, "0000-00-00")["seconds"].sum() == expected
+
+def test_top_tracks_are_ranked_by_streams(store, fake_lastfm):
+    tracks = fake_lastfm(1_000).tracks()
+    scrobble_store.insert_scrobbles(store, USER, columns(tracks))
+
+    top = scrobble_store.top_tracks_between(store, USER, "0000-00-00")
+
+    assert top["Rank"].tolist() == list(range(1, len(top) + 1))
+    assert top["Streams"].is_monotonic_decreasing
+    assert top["Streams"].sum() == 1_000
+
+    names = pd.Series([(track["name"], track["artist"]["#text"]) for track in tracks]).value_counts()
+    assert top.set_index(["Track", "Artist"])["Streams"].to_dict() == names.to_dict()
+
+def test_day_bounds_are_inclusive(store, fake_lastfm):
+    tracks = fake_lastfm(1_000).tracks()
+    scrobble_store.insert_scrobbles(store, USER, columns(tracks))
+    days = scrobble_store.daily_stats(store, USER, "0000-00-00")
+
+    first, last = days["day"].iloc[0], days["day"].iloc[-1]
+
+    assert scrobble_store.artist_plays_between(store, USER, first, first)["count"].sum() == days["scrobbles"].iloc[0]
+    assert scrobble_store.artist_plays_between(store, USER, last)["count"].sum() == days["scrobbles"].iloc[-1]
+
+def test_approximate_stats_are_close(store, fake_lastfm):
+    scrobble_store.insert_scrobbles(store, USER, columns(fake_lastfm(5_000).tracks()))
+
+    exact = scrobble_store.stats_between(store, USER, None)
+    approximate = scrobble_store.stats_between(store, USER, None, approximate=True)
+
+    assert approximate["scrobbles"] == exact["scrobbles"]
+    for kind in ("unique_tracks", "unique_artists"):
+        assert approximate[kind] == pytest.approx(exact[kind], rel=0.05)
+
+def test_sync_with_max_pages_leaves_no_gap(store, fake_lastfm):
+    lastfm = fake_lastfm(1_000)
+    oldest = [int(track["date"]["uts"]) for track in lastfm.tracks()]
+
+    inserted, complete = scrobble_store.sync_recent_tracks(store, lastfm, USER, 0, max_pages=2)
+
+    assert not complete
+    assert inserted == 2 * benchmark.PAGE_SIZE
+    assert scrobble_store.high_water_mark(store, USER) == oldest[inserted - 1]
+    assert scrobble_store.last_synced(store, USER, "recent_tracks") is None
+
+    inserted, complete = scrobble_store.sync_recent_tracks(store, lastfm, USER, 0)
+
+    assert complete
+    assert inserted == 1_000 - 2 * benchmark.PAGE_SIZE
+    assert scrobble_store.scrobble_count(store, USER) == 1_000
+    assert scrobble_store.last_synced(store, USER, "recent_tracks") is not None
+
+def test_read_page_orders_and_counts(store, fake_lastfm):
+    tracks = fake_lastfm(500).tracks()
+    scrobble_store.insert_scrobbles(store, USER, columns(tracks))
+    uts = sorted(int(track["date"]["uts"]) for track in tracks)
+
+    newest, total = scrobble_store.read_page(store, "scrobbles", USER, 10, 20)
+    oldest, _ = scrobble_store.read_page(store, "scrobbles", USER, 0, 20, since=uts[100], descending=False)
+
+    assert total == 500
+    assert newest["uts"].tolist() == uts[::-1][10:30]
+    assert oldest["uts"].tolist() == uts[100:120]
+
+def test_read_page_search_is_literal(store):
+    names = ["100% pure", "1000 pure", "under_score", "underXscore"]
+    scrobble_store.insert_scrobbles(store, USER, {"Track": names,
+                                                   "Artist": ["Artist"] * 4,
+                                                   "Album": ["Album"] * 4,
+                                                   "uts": np.arange(4, dtype=np.int64) + benchmark.START_UTS})
+
+    for search, expected in (("0%", ["100% pure"]), ("r_s", ["under_score"])):
+        page, total = scrobble_store.read_page(store, "scrobbles", USER, 0, 10, search=search)
+
+        assert total == 1
+        assert page["Track"].tolist() == expected
@@ -0,0 +1,83 @@
+import functools
+
+import pytest
+
+import data_layer
+import ingest
+import scrobble_store
+import snapshot
+import sync_worker
+
+USER = "user"
+
+@pytest.fixture
+def history(store, fake_lastfm, tmp_path, monkeypatch):
+    """A store whose snapshot was written before its newest 500 scrobbles arrived"""
+
+    tracks = fake_lastfm(3_000).tracks()
+    directory = str(tmp_path / "snapshots")
+    monkeypatch.setattr(data_layer, "get_store", lambda: store)
+    monkeypatch.setattr(snapshot, "open_snapshot", functools.partial(snapshot.open_snapshot, directory=directory))
+    monkeypatch.setattr(snapshot, "write_snapshot", functools.partial(snapshot.write_snapshot, directory=directory))
+
+    scrobble_store.insert_scrobbles(store, USER, ingest.recent_tracks_to_columns(tracks[:2_500]))
+    snapshot.write_snapshot(store, USER)
+    scrobble_store.insert_scrobbles(store, USER, ingest.recent_tracks_to_columns(tracks[2_500:]))
+
+    return store, snapshot.open_snapshot(USER)
+
+def by_key(frame, keys, plays):
+    return frame.set_index(keys)[plays].to_dict()
+
+def days(store):
+    return scrobble_store.daily_stats(store, USER, "0000-00-00")["day"].tolist()
+
+def test_snapshot_records_what_it_counts(history):
+    store, mapped = history
+
+    assert mapped.scrobbles == 2_500
+    assert mapped.partial_from == scrobble_store.local_day(mapped.max_uts)
+    assert mapped.partial_from in days(store)
+
+    rollup = mapped.rollup_between("daily_artist_plays", "0000-00-00")
+    assert rollup.num_rows
+    assert max(rollup.column("day").to_pylist()) < mapped.partial_from
+
+@pytest.mark.parametrize("table, read", [("daily_track_plays", scrobble_store.top_tracks_between),
+                                         ("daily_artist_plays", scrobble_store.artist_plays_between)])
+def test_merged_plays_match_the_store(history, table, read):
+    store, mapped = history
+    keys, plays = snapshot.TOTALS[table]
+    stored = days(store)
+    first, last = stored[0], stored[-1]
+    before = stored[stored.index(mapped.partial_from) - 1]
+
+    # all time, a range ending on the snapshot's last complete day, one ending on its
+    # partial day, and one starting past the snapshot
+    for start_day, end_day in ((first, None), (first, before), (stored[1], mapped.partial_from),
+                               (mapped.partial_from, last)):
+        merged = data_layer._plays_between(USER, table, start_day, end_day)
+        expected = read(store, USER, start_day, end_day)
+
+        assert by_key(merged, keys, plays) == by_key(expected, keys, plays)
+        assert merged[plays].is_monotonic_decreasing
+        if table == "daily_track_plays":
+            assert merged["Rank"].tolist() == list(range(1, len(merged) + 1))
+
+def test_a_backfill_gets_the_snapshot_rewritten(history, fake_lastfm):
+    store, _ = history
+    sync_worker.sync_snapshot(store, USER)
+    mapped = snapshot.open_snapshot(USER)
+
+    older = [dict(track, date={"uts": str(int(track["date"]["uts"]) - 30 * 86_400)})
+             for track in fake_lastfm(200, seed=1).tracks()]
+    scrobble_store.insert_scrobbles(store, USER, ingest.recent_tracks_to_columns(older))
+
+    # the high-water mark hasn't moved, but the backfilled days are past the snapshot's
+    assert scrobble_store.high_water_mark(store, USER) == mapped.max_uts
+    sync_worker.sync_snapshot(store, USER)
+    assert snapshot.open_snapshot(USER).scrobbles == 3_200
+
+    first = days(store)[0]
+    merged = data_layer._plays_between(USER, "daily_artist_plays", first)
+    assert merged["count"].sum() == 3_200
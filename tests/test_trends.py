@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import ingest
+import scrobble_store
+import trends
+
+USER = "user"
+
+def series(n, seed=0):
+    rng = np.random.default_rng(seed)
+
+    return np.arange(n, dtype=np.int64) * 3600, rng.poisson(5, n)
+
+@pytest.mark.parametrize("n, threshold", [(10_000, 1_000), (1_001, 1_000), (100, 3), (7_919, 250)])
+def test_lttb_keeps_the_endpoints_and_the_budget(n, threshold):
+    x, y = series(n)
+
+    keep = trends.lttb(x, y, threshold)
+
+    assert len(keep) == threshold
+    assert keep[0] == 0 and keep[-1] == n - 1
+    assert np.all(np.diff(keep) > 0)
+
+@pytest.mark.parametrize("threshold", [1_000, 5_000, 2, 0])
+def test_lttb_keeps_everything_it_cannot_reduce(threshold):
+    x, y = series(1_000)
+
+    assert trends.lttb(x, y, threshold).tolist() == list(range(1_000))
+
+def test_lttb_keeps_a_lone_spike():
+    x, y = series(10_000)
+    y[4_321] = 10_000
+
+    assert 4_321 in trends.lttb(x, y, 100)
+
+def test_dense_series_fills_empty_hours():
+    start = 1_700_000_000 // 3600 * 3600
+    bins = [(start // 3600 + 1, 4), (start // 3600 + 5, 2)]
+
+    x, y = trends.dense_series(bins, "hour", start, start + 6 * 3600)
+
+    assert x.tolist() == [start + hour * 3600 for hour in range(6)]
+    assert y.tolist() == [0, 4, 0, 0, 0, 2]
+
+def test_dense_series_fills_empty_days():
+    start = trends.TIMEZONE.localize(datetime(2024, 3, 1))
+    end = trends.TIMEZONE.localize(datetime(2024, 3, 5))
+
+    x, y = trends.dense_series([("2024-03-02", 7)], "day", int(start.timestamp()), int(end.timestamp()))
+
+    assert [scrobble_store.local_day(day) for day in x] == ["2024-03-01", "2024-03-02", "2024-03-03", "2024-03-04"]
+    assert y.tolist() == [0, 7, 0, 0]
+
+def test_trend_sums_to_the_stored_plays(store, fake_lastfm):
+    tracks = fake_lastfm(2_000).tracks()
+    scrobble_store.insert_scrobbles(store, USER, ingest.recent_tracks_to_columns(tracks))
+    uts = [int(track["date"]["uts"]) for track in tracks]
+    start = datetime.fromtimestamp(min(uts), trends.TIMEZONE) - timedelta(hours=1)
+    end = datetime.fromtimestamp(max(uts), trends.TIMEZONE) + timedelta(hours=1)
+
+    hourly = trends.trend(store, USER, "hour", start, end)
+    daily = trends.trend(store, USER, "day", start, end)
+
+    # both fit the pixel budget whole, so nothing is dropped
+    assert hourly.sum() == daily.sum() == 2_000
+    assert hourly.index.is_monotonic_increasing
+
+    assert len(trends.trend(store, USER, "hour", start, end, threshold=20)) == 20
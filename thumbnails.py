@@ -0,0 +1,100 @@
+import base64
+import functools
+import hashlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from PIL import Image, ImageOps
+
+import metrics
+
+### ENV. VARIABLES ###
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", "thumbnails")
+
+### CONSTANTS ###
+SIZE = 64
+QUALITY = 85
+TIMEOUT = 5
+MAX_WORKERS = 8
+# a failed download is retried after this long rather than on every rerun
+RETRY_AFTER = 10 * 60
+
+_SESSION = requests.Session()
+_FAILED = {}
+_LOCK = threading.Lock()
+
+### FUNCTIONS ###
+def thumbnail_path(url):
+    """Where the thumbnail for `url` lives: THUMBNAIL_DIR/<sha256[:2]>/<sha256>.jpg"""
+
+    digest = hashlib.sha256(url.encode()).hexdigest()
+
+    return os.path.join(THUMBNAIL_DIR, digest[:2], f"{digest}.jpg")
+
+def fetch_thumbnail(url):
+    """Downloads `url` once and stores it as a SIZE x SIZE JPEG; returns the file path"""
+
+    path = thumbnail_path(url)
+    if os.path.exists(path):
+        metrics.inc("thumbnail_requests_total", result="hit")
+        return path
+
+    response = _SESSION.get(url, timeout=TIMEOUT)
+    response.raise_for_status()
+
+    image = ImageOps.fit(Image.open(io.BytesIO(response.content)).convert("RGB"), (SIZE, SIZE))
+
+    # written to a temp file first so a concurrent reader never sees half an image
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    image.save(temp_path, format="JPEG", quality=QUALITY)
+    os.replace(temp_path, path)
+
+    metrics.inc("thumbnail_requests_total", result="miss")
+    metrics.inc("thumbnail_bytes_total", len(response.content), kind="original")
+    metrics.inc("thumbnail_bytes_total", os.path.getsize(path), kind="thumbnail")
+
+    return path
+
+@functools.lru_cache(maxsize=2048)
+def _data_uri(path):
+    with open(path, "rb") as f:
+        return "data:image/jpeg;base64," + base64.b64encode(f.read()).decode()
+
+def data_uri(url):
+    """The cached thumbnail for `url` as a data URI, or `url` itself if it can't be fetched
+
+    Falling back to the remote URL keeps the cell showing something; the download is
+    retried after RETRY_AFTER.
+    """
+
+    if not url:
+        return url
+
+    with _LOCK:
+        if time.time() - _FAILED.get(url, 0) < RETRY_AFTER:
+            return url
+
+    try:
+        return _data_uri(fetch_thumbnail(url))
+    except Exception as e:
+        print(f"Error fetching thumbnail for {url}: {e}")
+        metrics.inc("thumbnail_requests_total", result="error")
+        with _LOCK:
+            _FAILED[url] = time.time()
+        return url
+
+def data_uris(urls):
+    """data_uri over a column of image URLs, downloading the uncached ones concurrently"""
+
+    urls = list(urls)
+    unique = list(dict.fromkeys(urls))
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        uris = dict(zip(unique, executor.map(data_uri, unique)))
+
+    return [uris[url] for url in urls]
@@ -0,0 +1,40 @@
+import plotly.express as px
+import streamlit as st
+
+import data_layer
+import grid
+
+### FUNCTIONS ###
+def render(user, periods):
+    """The last.fm Top Artists pane, counted from the stored scrobbles
+
+    `periods` maps labels to last.fm periods. Only those the store reaches back over
+    are offered, plus everything it holds, labelled with the day it starts.
+    """
+
+    first_day = data_layer.stored_since(user)
+    if first_day is None:
+        st.caption("No scrobbles stored yet")
+        return
+
+    options = {label: period for label, period in periods.items()
+               if period != "overall" and data_layer.period_start(period) >= first_day}
+    options[f"Since {first_day}"] = "overall"
+
+    col1, col2 = st.columns([1.5, 1])
+    with col1:
+        label = st.selectbox("Select time period",
+                             options=list(options),
+                             key="lastfm_top_artists_period")
+        ranked = data_layer.top_artists(user, options[label])
+
+        st.markdown(f"### Your Top Artists: {label}")
+        grid.show(ranked,
+                  grid.options(ranked, bold="Artist",
+                               max_widths={"Rank": 100, "Streams": 120}))
+        st.caption(f"Counted from the scrobbles stored locally, which start on {first_day}.")
+
+    with col2:
+        fig = px.bar(ranked.head(20).iloc[::-1], x="Streams", y="Artist", orientation="h")
+        fig.update_layout(title="Top 20 Artists", height=800)
+        st.plotly_chart(fig, use_container_width=True)
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+import scrobble_store
+
+### CONSTANTS ###
+TIMEZONE = scrobble_store.TIMEZONE
+
+BINS = ["day", "hour"]
+# points per trace - about as many as a full-width chart has pixels to show them
+PIXEL_BUDGET = 1000
+
+### FUNCTIONS ###
+def dense_series(bins, bin, start, end):
+    """(x, y) for every bin in uts [start, end): each bin's start in epoch seconds, and its plays
+
+    `bins` are play_bins' non-empty (key, plays) rows; the bins in between get 0, so
+    a quiet stretch draws as a dip rather than a straight line across it.
+    """
+
+    if bin == "hour":
+        first = start // 3600
+        x = np.arange(first, -(-end // 3600), dtype=np.int64)
+        positions = {hour: hour - first for hour in x.tolist()}
+        x = x * 3600
+    else:
+        days = pd.date_range(scrobble_store.local_day(start), scrobble_store.local_day(end - 1), freq="D")
+        positions = {day: i for i, day in enumerate(days.strftime("%Y-%m-%d"))}
+        x = np.array([TIMEZONE.localize(day.to_pydatetime()).timestamp() for day in days], dtype=np.int64)
+
+    y = np.zeros(len(x), dtype=np.int64)
+    for key, plays in bins:
+        y[positions[key]] = plays
+
+    return x, y
+
+def lttb(x, y, threshold=PIXEL_BUDGET):
+    """Indices of the `threshold` points Largest-Triangle-Three-Buckets keeps of (x, y)
+
+    The first and last points are kept; in between, each bucket contributes the point
+    forming the largest triangle with the previously kept point and the next bucket's
+    average, which preserves peaks and dips that plain striding would drop.
+    """
+
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    kept = 0
+
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+
+        area = np.abs((x[kept] - avg_x) * (y[lo:hi] - y[kept]) - (x[kept] - x[lo:hi]) * (avg_y - y[kept]))
+        kept = keep[i + 1] = lo + int(np.argmax(area))
+
+    return keep
+
+def trend(conn, user, bin, start, end, threshold=PIXEL_BUDGET, **filters):
+    """Plays per `bin` over tz-aware [start, end), downsampled to `threshold` points
+
+    `filters` are play_bins' track/artist/artists. Returns a Series of plays indexed
+    by TIMEZONE timestamps, ready to become one go.Scatter trace.
+    """
+
+    start, end = int(start.timestamp()), int(end.timestamp())
+    x, y = dense_series(scrobble_store.play_bins(conn, user, bin, start, end, **filters), bin, start, end)
+    keep = lttb(x, y, threshold)
+
+    return pd.Series(y[keep], index=pd.to_datetime(x[keep], unit="s", utc=True).tz_convert(TIMEZONE), name="plays")